@@ -0,0 +1,142 @@
+'''
+图像 / mask 编码对比：统计各编码在样例影像上的平均字节数与编码耗时，用于按部署选择编码
+
+用法:
+    python bench_codecs.py scan1.dcm scan2.png ... [--repeat 5] [--with-model]
+
+未指定 --with-model 时，mask 使用影像中的椭圆样例病灶（与真实病灶 mask 一样是大面积空白中的实心区域）；
+指定后使用 ./model.pt 的真实分割结果。输出为 Markdown 表格。
+只对 PNG / JPEG 样例做对比时不需要 pydicom、cv2 与模型依赖。
+'''
+import argparse
+import gzip
+import json
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from payload_codecs import encode_image, encode_mask, pack_mask, zstandard
+
+
+IMAGE_VARIANTS = [
+    ('png (level 1)', 'png', {'compress_level': 1}),
+    ('png (level 6)', 'png', {'compress_level': 6}),
+    ('png (level 9)', 'png', {'compress_level': 9}),
+    ('jpeg (q=95)', 'jpeg', {'quality': 95}),
+    ('jpeg (q=80)', 'jpeg', {'quality': 80}),
+    ('webp (lossless)', 'webp', {'lossless': True}),
+    ('webp (q=90)', 'webp', {'quality': 90}),
+]
+MASK_VARIANTS = ['png', 'png1', 'packbits']
+
+
+def load_scan(path):
+    '''读取样例影像，DICOM 使用与 /predict 相同的窗位窗宽处理'''
+    if path.lower().endswith('.dcm'):
+        import pydicom as dicom
+        ds = dicom.dcmread(path, force=True)
+        pixels = ds.pixel_array
+        if int(ds.get('NumberOfFrames', 1) or 1) > 1:
+            pixels = pixels[0]
+        ct = float(ds.get('RescaleIntercept', 0)) + float(ds.get('RescaleSlope', 1)) * pixels.astype(np.float64)
+        if 'WindowCenter' in ds and 'WindowWidth' in ds:
+            center, width = (float(v[0] if isinstance(v, dicom.multival.MultiValue) else v)
+                             for v in (ds.WindowCenter, ds.WindowWidth))
+            ct_min, ct_max = center - width / 2, center + width / 2
+        else:  # 样例缺少窗位窗宽时按像素范围显示
+            ct_min, ct_max = float(ct.min()), float(ct.max())
+        ct = np.clip(ct, ct_min, ct_max)
+        img = Image.fromarray(((ct - ct_min) / (ct_max - ct_min + 1e-5) * 255).astype(np.uint8))
+        img.thumbnail((640, 640), Image.LANCZOS)
+    else:
+        img = Image.open(path)
+    return img.convert('RGB')
+
+
+def sample_masks(img, model=None):
+    if model is not None:
+        from mask_analytics import resize_masks  # 需要 cv2
+        result = model.predict(img, imgsz=640, verbose=False)[0]
+        if result.masks is None:
+            return []
+        h, w = result.orig_shape
+        return list(resize_masks(result.masks.data.cpu().numpy(), w, h))
+    # 样例病灶：偏离中心、约占影像 3% 面积的椭圆
+    w, h = img.size
+    ys, xs = np.ogrid[:h, :w]
+    cx, cy, rx, ry = w * 0.6, h * 0.4, w * 0.12, h * 0.08
+    return [((((xs - cx) / rx) ** 2 + ((ys - cy) / ry) ** 2 <= 1) * 255).astype(np.uint8)]
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        output = func()
+    return output, (time.perf_counter() - start) / repeat * 1000
+
+
+def print_table(title, rows):
+    print(f"\n### {title}\n")
+    print("| 编码 | 平均字节数 | 相对大小 | 平均编码耗时 (ms) |")
+    print("|---|---:|---:|---:|")
+    baseline = rows[0][1] or 1
+    for name, size, ms in rows:
+        print(f"| {name} | {size:,.0f} | {size / baseline:.2f} | {ms:.2f} |")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='图像与 mask 编码对比')
+    parser.add_argument('scans', nargs='+', help='样例影像（.dcm / .png / .jpg）')
+    parser.add_argument('--repeat', type=int, default=5, help='每种编码重复次数')
+    parser.add_argument('--with-model', action='store_true', help='使用 ./model.pt 生成真实 mask')
+    args = parser.parse_args()
+
+    model = None
+    if args.with_model:
+        from ultralytics import YOLO
+        model = YOLO('./model.pt')
+
+    images = [load_scan(path) for path in args.scans]
+    masks = [mask for img in images for mask in sample_masks(img, model)]
+
+    image_rows = []
+    for name, codec, options in IMAGE_VARIANTS:
+        sizes, times = [], []
+        for img in images:
+            (data, _), ms = timed(lambda: encode_image(img, codec, **options), args.repeat)
+            sizes.append(len(data))
+            times.append(ms)
+        image_rows.append((name, np.mean(sizes), np.mean(times)))
+    print(f"样例影像 {len(images)} 张：{', '.join(os.path.basename(p) for p in args.scans)}")
+    print_table('原图', image_rows)
+
+    if masks:
+        mask_rows = []
+        for codec in MASK_VARIANTS:
+            sizes, times = [], []
+            for mask in masks:
+                (data, _), ms = timed(lambda: encode_mask(pack_mask(mask), codec), args.repeat)
+                sizes.append(len(data))
+                times.append(ms)
+            mask_rows.append((codec, np.mean(sizes), np.mean(times)))
+        print_table(f'Mask（{len(masks)} 个）', mask_rows)
+
+    # JSON 压缩（使用典型的预测结果结构）
+    body = json.dumps({'predictions': [{
+        'id': i + 1, 'bbox': [120.5, 88.25, 240.75, 199.0], 'original_label': 'Glioma', 'label': '胶质瘤',
+        'confidence': 0.87, 'box_width': 120.25, 'box_height': 110.75, 'mask_id': '0' * 36,
+    } for i in range(10)]}, ensure_ascii=False).encode('utf-8')
+    json_rows = [('identity', len(body), 0.0)]
+    data, ms = timed(lambda: gzip.compress(body, compresslevel=6), args.repeat)
+    json_rows.append(('gzip', len(data), ms))
+    if zstandard is not None:
+        compressor = zstandard.ZstdCompressor(level=3)
+        data, ms = timed(lambda: compressor.compress(body), args.repeat)
+        json_rows.append(('zstd', len(data), ms))
+    print_table('JSON（10 个目标）', json_rows)
+
+
+if __name__ == '__main__':
+    main()
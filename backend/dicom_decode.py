@@ -0,0 +1,278 @@
+'''
+DICOM 像素解码层
+- 按传输语法选择可用的最快解码插件
+- 多帧压缩对象在进程池中按帧并行解码
+- 解码结果按 SOPInstanceUID 缓存（内存预算内 LRU），同一实例以不同阈值重复分析时不会再次解码
+- 统计每种传输语法的解码耗时
+'''
+import hashlib
+import importlib.util
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+from pydicom import encaps
+
+
+DECODE_CACHE_MB = int(os.environ.get('DECODE_CACHE_MB', 512))  # 解码结果缓存上限（MB）
+DECODE_WORKERS = int(os.environ.get('DECODE_WORKERS', min(4, os.cpu_count() or 2)))  # 按帧并行解码的进程数（每个进程都会常驻内存，默认不超过 4 个）
+PARALLEL_MIN_FRAMES = 4  # 帧数少于该值时在当前线程解码（进程间传输的开销大于收益）
+
+DEFAULT_TRANSFER_SYNTAX = '1.2.840.10008.1.2'  # 缺少文件头时按 Implicit VR Little Endian 处理
+TRANSFER_SYNTAXES = {
+    '1.2.840.10008.1.2': 'Implicit VR Little Endian',
+    '1.2.840.10008.1.2.1': 'Explicit VR Little Endian',
+    '1.2.840.10008.1.2.1.99': 'Deflated Explicit VR Little Endian',
+    '1.2.840.10008.1.2.2': 'Explicit VR Big Endian',
+    '1.2.840.10008.1.2.4.50': 'JPEG Baseline',
+    '1.2.840.10008.1.2.4.51': 'JPEG Extended',
+    '1.2.840.10008.1.2.4.57': 'JPEG Lossless',
+    '1.2.840.10008.1.2.4.70': 'JPEG Lossless SV1',
+    '1.2.840.10008.1.2.4.80': 'JPEG-LS Lossless',
+    '1.2.840.10008.1.2.4.81': 'JPEG-LS Near-Lossless',
+    '1.2.840.10008.1.2.4.90': 'JPEG 2000 Lossless',
+    '1.2.840.10008.1.2.4.91': 'JPEG 2000',
+    '1.2.840.10008.1.2.5': 'RLE Lossless',
+}
+
+# 各压缩传输语法可用的按帧解码插件（按速度优先排列），其余语法交给 pydicom
+FRAME_DECODERS = {
+    '1.2.840.10008.1.2.4.50': ['pillow', 'libjpeg'],
+    '1.2.840.10008.1.2.4.51': ['libjpeg'],
+    '1.2.840.10008.1.2.4.57': ['libjpeg'],
+    '1.2.840.10008.1.2.4.70': ['libjpeg'],
+    '1.2.840.10008.1.2.4.80': ['libjpeg', 'charls'],
+    '1.2.840.10008.1.2.4.81': ['libjpeg', 'charls'],
+    '1.2.840.10008.1.2.4.90': ['openjpeg', 'pillow_j2k'],
+    '1.2.840.10008.1.2.4.91': ['openjpeg', 'pillow_j2k'],
+}
+
+
+def _plugin_available(plugin):
+    if plugin == 'libjpeg':  # pylibjpeg-libjpeg
+        return importlib.util.find_spec('libjpeg') is not None
+    if plugin == 'openjpeg':  # pylibjpeg-openjpeg
+        return importlib.util.find_spec('openjpeg') is not None
+    if plugin == 'charls':  # pyjpegls / CharPyLS
+        return importlib.util.find_spec('jpeg_ls') is not None
+    if plugin in ('pillow', 'pillow_j2k'):
+        from PIL import features
+        return features.check_codec('jpg_2000' if plugin == 'pillow_j2k' else 'jpg')
+    return False
+
+
+def decode_frame(plugin, frame):
+    '''解码一帧压缩数据（在进程池中执行，必须是模块级函数）'''
+    if plugin == 'libjpeg':
+        from libjpeg import decode
+        return decode(frame)
+    if plugin == 'openjpeg':
+        from openjpeg import decode
+        return decode(frame)
+    if plugin == 'charls':
+        import jpeg_ls
+        return jpeg_ls.decode(np.frombuffer(frame, dtype=np.uint8))
+    if plugin in ('pillow', 'pillow_j2k'):
+        from PIL import Image
+        return np.asarray(Image.open(io.BytesIO(frame)))
+    raise ValueError(f'Unknown decoder plugin: {plugin}')
+
+
+def transfer_syntax(dicom_data):
+    file_meta = getattr(dicom_data, 'file_meta', None)
+    uid = file_meta.get('TransferSyntaxUID') if file_meta is not None else None
+    return str(uid) if uid else DEFAULT_TRANSFER_SYNTAX
+
+
+def _frames(dicom_data, number_of_frames):
+    '''拆分封装的像素数据（兼容 pydicom 2.x / 3.x）'''
+    if hasattr(encaps, 'generate_frames'):
+        return list(encaps.generate_frames(dicom_data.PixelData, number_of_frames=number_of_frames))
+    return list(encaps.generate_pixel_data_frame(dicom_data.PixelData, number_of_frames))
+
+
+def _apply_pixel_representation(arr, dicom_data):
+    '''有符号像素：部分解码器按无符号返回，按 BitsStored 做符号扩展'''
+    if int(dicom_data.get('PixelRepresentation', 0) or 0) != 1 or arr.dtype.kind != 'u':
+        return arr
+    signed = arr.astype(arr.dtype.str.replace('u', 'i'))
+    shift = signed.dtype.itemsize * 8 - int(dicom_data.get('BitsStored', signed.dtype.itemsize * 8))
+    if shift > 0:
+        signed = (signed << shift) >> shift
+    return signed
+
+
+class PixelDecoder:
+    '''DICOM 像素解码与缓存，线程安全'''
+
+    def __init__(self, cache_mb=DECODE_CACHE_MB, workers=DECODE_WORKERS):
+        self.max_bytes = cache_mb * 1024 * 1024
+        self.workers = workers
+        self._frames = OrderedDict()  # 缓存 key -> 解码后的数组（只读）
+        self._bytes = 0
+        self._inflight = {}  # 正在解码的 key -> Future，同一实例并发请求只解码一次
+        self._plugins = {}  # 传输语法 -> 选中的插件
+        self._stats = {}  # 传输语法 -> 解码统计
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def decode(self, dicom_data):
+        '''
+        返回像素数组，形状与 pixel_array 相同：单帧 (行, 列[, 通道])，多帧 (帧, 行, 列[, 通道])
+        返回的数组为只读，调用方需要修改时先复制
+        '''
+        key = self._cache_key(dicom_data)
+        syntax = transfer_syntax(dicom_data)
+        with self._lock:
+            arr = self._frames.get(key)
+            if arr is not None:
+                self._frames.move_to_end(key)
+                self._stat(syntax)['cache_hits'] += 1
+                return arr
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            arr = self._decode(dicom_data, syntax)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        arr.flags.writeable = False
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._put(key, arr)
+        future.set_result(arr)
+        return arr
+
+    def plugin_for(self, syntax):
+        '''该传输语法可用的最快按帧解码插件，没有时返回 None（交给 pydicom）'''
+        with self._lock:
+            if syntax not in self._plugins:
+                self._plugins[syntax] = next(
+                    (plugin for plugin in FRAME_DECODERS.get(syntax, []) if _plugin_available(plugin)), None)
+            return self._plugins[syntax]
+
+    def stats(self):
+        '''每种传输语法的解码次数、帧数、耗时与缓存命中，以及缓存占用'''
+        with self._lock:
+            syntaxes = {}
+            for syntax, stat in self._stats.items():
+                stat = dict(stat)
+                stat['avg_ms'] = stat['total_ms'] / stat['decoded'] if stat['decoded'] else 0.0
+                stat['avg_frame_ms'] = stat['total_ms'] / stat['frames'] if stat['frames'] else 0.0
+                syntaxes[syntax] = stat
+            return {
+                'transfer_syntaxes': syntaxes,
+                'cache_entries': len(self._frames),
+                'cache_bytes': self._bytes,
+                'cache_max_bytes': self.max_bytes,
+            }
+
+    def memory_items(self):
+        '''内存统计：(key, 类别, 字节数)'''
+        with self._lock:
+            return [(key, f'decoded {arr.dtype}', arr.nbytes) for key, arr in self._frames.items()]
+
+    def shed(self, fraction):
+        '''按 LRU 顺序丢弃一部分解码结果，返回释放的字节数'''
+        freed = 0
+        with self._lock:
+            for _ in range(min(len(self._frames), max(1, int(len(self._frames) * fraction)))):
+                _, arr = self._frames.popitem(last=False)
+                self._bytes -= arr.nbytes
+                freed += arr.nbytes
+        return freed
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def _decode(self, dicom_data, syntax):
+        number_of_frames = int(dicom_data.get('NumberOfFrames', 1) or 1)
+        plugin = self.plugin_for(syntax)
+        start = time.perf_counter()
+        arr = None
+        if plugin is not None:
+            try:
+                frames = _frames(dicom_data, number_of_frames)
+                if len(frames) >= PARALLEL_MIN_FRAMES and self.workers > 1:
+                    chunksize = max(1, len(frames) // (self.workers * 4))
+                    decoded = list(self._get_pool().map(decode_frame, repeat(plugin), frames, chunksize=chunksize))
+                else:
+                    decoded = [decode_frame(plugin, frame) for frame in frames]
+                arr = _apply_pixel_representation(np.stack(decoded) if len(decoded) > 1 else decoded[0], dicom_data)
+            except Exception as e:
+                print(f"⚠️ {plugin} 解码失败，改用 pydicom: {e}")
+                arr = None
+        if arr is None:
+            plugin = 'pydicom'
+            arr = dicom_data.pixel_array
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            stat = self._stat(syntax)
+            stat['plugin'] = plugin
+            stat['decoded'] += 1
+            stat['frames'] += number_of_frames
+            stat['total_ms'] += elapsed_ms
+            stat['max_ms'] = max(stat['max_ms'], elapsed_ms)
+        return arr
+
+    def _stat(self, syntax):
+        stat = self._stats.get(syntax)
+        if stat is None:
+            stat = self._stats[syntax] = {
+                'name': TRANSFER_SYNTAXES.get(syntax, syntax),
+                'plugin': None,  # 最近一次使用的解码插件
+                'decoded': 0,  # 解码次数
+                'frames': 0,  # 解码帧数
+                'total_ms': 0.0,  # 累计解码耗时
+                'max_ms': 0.0,
+                'cache_hits': 0,  # 缓存命中次数
+            }
+        return stat
+
+    def _put(self, key, arr):
+        if arr.nbytes > self.max_bytes:
+            return
+        old = self._frames.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._frames[key] = arr
+        self._bytes += arr.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # 服务进程中已有多个线程（Flask、编码线程池、看门狗），fork 可能复制被持有的锁，改用 spawn
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    @staticmethod
+    def _cache_key(dicom_data):
+        '''优先使用 SOPInstanceUID，缺失时使用像素数据的哈希'''
+        sop_uid = str(dicom_data.get('SOPInstanceUID', '') or '')
+        if sop_uid:
+            return sop_uid
+        return 'sha1:' + hashlib.sha1(dicom_data.PixelData).hexdigest()
+
+
+# 进程内共享的解码器
+pixel_decoder = PixelDecoder()
@@ -0,0 +1,105 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+def extract_metadata(dicom_data):
+    '''从 DICOM 头中提取检索用的元数据'''
+    pixel_spacing = dicom_data.get('PixelSpacing')
+    acquisition_date = str(dicom_data.get('AcquisitionDate', '') or dicom_data.get('StudyDate', ''))
+    acquisition_time = str(dicom_data.get('AcquisitionTime', '') or dicom_data.get('StudyTime', ''))
+    return {
+        'patient_id': str(dicom_data.get('PatientID', '')),
+        'study_uid': str(dicom_data.get('StudyInstanceUID', '')),
+        'series_uid': str(dicom_data.get('SeriesInstanceUID', '')),
+        'sop_uid': str(dicom_data.get('SOPInstanceUID', '')),
+        'modality': str(dicom_data.get('Modality', '')),
+        'pixel_spacing': [float(v) for v in pixel_spacing] if pixel_spacing else None,  # [行间距, 列间距] mm
+        'acquisition_datetime': (acquisition_date + acquisition_time) or None,
+    }
+
+
+class DicomIndex:
+    '''
+    DICOM 元数据与预测结果的本地索引（SQLite）
+    所有查询都走索引，百万级记录下仍可在亚毫秒内完成
+    '''
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                image_id TEXT PRIMARY KEY,
+                patient_id TEXT,
+                study_uid TEXT,
+                series_uid TEXT,
+                sop_uid TEXT,
+                modality TEXT,
+                pixel_spacing_row REAL,
+                pixel_spacing_col REAL,
+                acquisition_datetime TEXT,
+                model TEXT,
+                model_version TEXT,
+                total_detections INTEGER,
+                result_json TEXT,
+                created_at REAL
+            )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_results_study ON results (study_uid, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_results_series ON results (series_uid, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_results_sop ON results (sop_uid, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_results_patient ON results (patient_id, created_at)')
+        conn.commit()
+
+    def _conn(self):
+        '''每个线程使用独立的连接'''
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def add(self, metadata, result_data):
+        spacing = metadata.get('pixel_spacing') or [None, None]
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (result_data['image_id'], metadata['patient_id'], metadata['study_uid'],
+             metadata['series_uid'], metadata['sop_uid'], metadata['modality'],
+             spacing[0], spacing[1], metadata['acquisition_datetime'],
+             result_data.get('model'), result_data.get('model_version'),
+             result_data.get('total_detections', 0),
+             json.dumps(result_data, ensure_ascii=False), time.time()))
+        conn.commit()
+
+    @staticmethod
+    def _row_to_dict(row):
+        result = json.loads(row['result_json'])
+        result['indexed_at'] = row['created_at']
+        return result
+
+    def study_results(self, study_uid, limit=1000):
+        '''某个检查（Study）的所有结果'''
+        rows = self._conn().execute(
+            'SELECT result_json, created_at FROM results WHERE study_uid = ? ORDER BY created_at LIMIT ?',
+            (study_uid, limit)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def latest_series_result(self, series_uid):
+        '''某个序列（Series）的最新结果'''
+        row = self._conn().execute(
+            'SELECT result_json, created_at FROM results WHERE series_uid = ? ORDER BY created_at DESC LIMIT 1',
+            (series_uid,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def instance_processed(self, sop_uid):
+        '''某个实例（SOPInstanceUID）是否已处理，返回最近一次的记录摘要'''
+        row = self._conn().execute(
+            'SELECT image_id, model, model_version, total_detections, created_at FROM results '
+            'WHERE sop_uid = ? ORDER BY created_at DESC LIMIT 1',
+            (sop_uid,)).fetchone()
+        return dict(row) if row else None
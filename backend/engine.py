@@ -0,0 +1,349 @@
+'''
+推理引擎：/predict 的完整处理流程（影像读取、模型推理、快速筛查、诊断总结）
+不依赖 Flask，后端服务与桌面端本地模式共用
+
+    engine = create_engine()
+    img, file_ext, dicom_metadata = load_image(open(path, 'rb'), path)
+    analysis = engine.analyze(img, conf_threshold=0.5, iou_threshold=0.7)
+'''
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pydicom as dicom
+import torch
+from PIL import Image
+
+from dicom_decode import pixel_decoder
+from dicom_index import extract_metadata
+from mask_analytics import mask_statistics
+from model_registry import ModelRegistry
+
+# 添加标签映射表
+label_mapping = {
+    'Glioma': '胶质瘤',
+    'Meningioma': '脑膜瘤',
+    'Pituitary tumor': '垂体瘤'
+}
+
+# 肿瘤类型特异性阈值定义（单位：像素面积）
+TUMOR_TYPE_THRESHOLDS = {
+    'Glioma': {  # 胶质瘤
+        'high_risk': 5000,   # 高风险面积阈值
+        'medium_risk': 2000  # 中等风险面积阈值
+    },
+    'Meningioma': {  # 脑膜瘤
+        'high_risk': 8000,
+        'medium_risk': 4000
+    },
+    'Pituitary tumor': {  # 垂体瘤
+        'high_risk': 3000,
+        'medium_risk': 1500
+    }
+}
+
+# 推理尺寸与快速筛查配置
+FULL_IMGSZ = 640  # 全分辨率分割的输入尺寸
+TRIAGE_IMGSZ = int(os.environ.get('TRIAGE_IMGSZ', 320))  # 快速筛查的输入尺寸
+TRIAGE_CONF = float(os.environ.get('TRIAGE_CONF', 0.1))  # 快速筛查的置信度阈值（偏向召回）
+TRIAGE_MODEL = os.environ.get('TRIAGE_MODEL')  # 快速筛查使用的轻量模型，留空则使用请求的模型
+
+# 模型配置：可通过 MODEL_CONFIG 指定多模型 JSON 配置，否则加载默认的 model.pt
+MODEL_CONFIG = os.environ.get('MODEL_CONFIG')
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('MODEL_MEMORY_BUDGET_MB', 4096))  # 模型内存预算
+DEFAULT_MODEL_PATH = './model.pt'
+
+
+class UnsupportedFormatError(ValueError):
+    '''不支持的文件格式'''
+
+
+def load_image(stream, filename):
+    '''
+    读取上传的影像（DICOM 按窗位窗宽转换为灰度图）
+    :return: (PIL 图像, 规范化后的扩展名, DICOM 元数据或 None)
+    '''
+    file_ext = os.path.splitext(filename)[1].lower()
+    dicom_metadata = None
+
+    if file_ext == '.dcm':
+        # 读取 DICOM 文件
+        dicom_data = dicom.dcmread(stream,force=True)
+        dicom_metadata = extract_metadata(dicom_data)  # 患者/检查/序列/实例等元数据
+        info20 = dicom_data.RescaleIntercept# RescaleIntercept翻译为“缩放截取”，即CT的窗位窗宽
+        info21 = int(dicom_data.RescaleSlope)# RescaleSlope翻译为“缩放斜率”，即CT的窗宽
+        info22 = pixel_decoder.decode(dicom_data) #  获取像素值（按传输语法解码并按 SOPInstanceUID 缓存）
+        if int(dicom_data.get('NumberOfFrames', 1) or 1) > 1:
+            info22 = info22[0]  # 多帧对象取第一帧
+        # 得出密度值
+        CT = info20 + info21 * info22  # 将像素值转换为 Hounsfield 单位
+
+        info18 = dicom_data.WindowCenter
+        info19 = dicom_data.WindowWidth
+        # 计算窗位窗宽
+        CT_min = info18 - info19/2
+        CT_max = info18 + info19/2
+        CT = np.clip(CT, CT_min, CT_max)  # 限制 CT 值在窗位窗宽范围内
+        # 归一化处理
+        CT_image = (CT - CT_min) / (CT_max - CT_min + 1e-5) * 255 # 防止除零错误
+        # 转换为 PIL 图像
+        img = Image.fromarray(CT_image.astype(np.uint8))# 转换为灰度图像
+        # 缩放至最大 640x640，保持宽高比
+        max_size = (640, 640)
+        img.thumbnail(max_size, Image.LANCZOS)  # thumbnail 自动保持比例
+        if dicom_metadata['pixel_spacing']:
+            # 缩放后每个像素对应的物理尺寸 [行间距, 列间距] mm
+            row_mm, col_mm = dicom_metadata['pixel_spacing']
+            dicom_metadata['image_pixel_spacing'] = [row_mm * CT.shape[0] / img.height,
+                                                     col_mm * CT.shape[1] / img.width]
+        
+    elif file_ext in ['.png', '.jpg', '.jpeg']:
+        img = Image.open(stream)
+        # Image.open 只读取文件头：在此完整解码，调用方关闭文件或在多个线程中共享图像时才是安全的
+        img.load()
+        if file_ext in ['.jpg', '.jpeg']:
+            file_ext = '.jpg'
+        else:
+            file_ext = '.png'
+    else:
+        raise UnsupportedFormatError(f'Unsupported file format: {file_ext}')
+
+    return img, file_ext, dicom_metadata
+
+
+def render_labeled(result):
+    '''使用 YOLO 的 plot 方法生成带检测框和标签的图像（RGB numpy 数组）'''
+    labeled_img = result.plot()  # 返回的是 numpy array (BGR 格式)
+    return cv2.cvtColor(labeled_img, cv2.COLOR_BGR2RGB)  # 转为 RGB
+
+
+def result_nbytes(result):
+    '''推理结果持有的原图与张量占用的字节数（用于内存统计）'''
+    total = result.orig_img.nbytes if getattr(result, 'orig_img', None) is not None else 0
+    for tensor in (getattr(result.boxes, 'data', None), getattr(result.masks, 'data', None)):
+        if tensor is not None:
+            total += tensor.element_size() * tensor.nelement()
+    return total
+
+
+def build_predictions(result):
+    '''将模型输出整理为预测列表（不含 mask_id，由调用方按存储方式填写）'''
+    predictions = []
+    for idx, box in enumerate(result.boxes):
+        x1, y1, x2, y2 = map(float, box.xyxy[0])
+        conf = float(box.conf)
+        cls = int(box.cls)
+        label = result.names[cls]
+
+        chinese_label = label_mapping.get(label, label)
+
+        width = x2 - x1
+        height = y2 - y1
+
+        predictions.append({
+            'id': idx + 1,
+            'bbox': [x1, y1, x2, y2],
+            'original_label': label,
+            'label': chinese_label,
+            'confidence': conf,
+            'box_width': width,
+            'box_height': height,
+            'mask_id': None,
+            'mask_stats': None,  # 病灶 mask 统计（面积、质心、周长、重叠等），无 mask 时为 None
+            'risk_level': None,  # high / medium / low，面积确定后由 analyze 填写
+        })
+    return predictions
+
+
+def lesion_area(pred):
+    '''优先使用 mask 的真实像素面积，没有 mask 时以检测框面积近似'''
+    mask_stats = pred.get('mask_stats')
+    return mask_stats['area'] if mask_stats else pred['box_width'] * pred['box_height']
+
+
+def risk_level(tumor_type, area):
+    '''按肿瘤类型阈值判断单个病灶的风险等级：high / medium / low，未知类型返回 None'''
+    thresholds = TUMOR_TYPE_THRESHOLDS.get(tumor_type)
+    if thresholds is None:
+        return None
+    if area > thresholds['high_risk']:
+        return 'high'
+    if area > thresholds['medium_risk']:
+        return 'medium'
+    return 'low'
+
+
+def generate_diagnosis_summary(predictions):
+    diagnosis_summary = []
+    
+    if not predictions:
+        diagnosis_summary.append("🟢 未检测到肿瘤迹象。")
+        return diagnosis_summary
+        
+    # 按类型分类统计
+    tumor_stats = {
+        'Glioma': {'count': 0, 'max_area': 0, 'total_area': 0, 'max_physical_area': None},
+        'Meningioma': {'count': 0, 'max_area': 0, 'total_area': 0, 'max_physical_area': None},
+        'Pituitary tumor': {'count': 0, 'max_area': 0, 'total_area': 0, 'max_physical_area': None}
+    }
+    
+    for pred in predictions:
+        tumor_type = pred['original_label']
+        mask_stats = pred.get('mask_stats')
+        area = lesion_area(pred)
+        
+        if tumor_type in tumor_stats:
+            tumor_stats[tumor_type]['count'] += 1
+            tumor_stats[tumor_type]['total_area'] += area
+            if area > tumor_stats[tumor_type]['max_area']:
+                tumor_stats[tumor_type]['max_area'] = area
+                tumor_stats[tumor_type]['max_physical_area'] = mask_stats['physical_area'] if mask_stats else None
+    
+    # 为每种类型的肿瘤生成建议
+    for tumor_type, stats in tumor_stats.items():
+        if stats['count'] == 0:
+            continue
+            
+        thresholds = TUMOR_TYPE_THRESHOLDS[tumor_type]
+        max_area = stats['max_area']
+        # DICOM 影像附带最大病灶的物理面积
+        physical = f"（约 {stats['max_physical_area']:.1f} mm²）" if stats['max_physical_area'] else ""
+        
+        level = risk_level(tumor_type, max_area)
+        if level == 'high':
+            diagnosis_summary.append(f"🔴【高风险】检测到{label_mapping[tumor_type]}且最大病灶面积超过{thresholds['high_risk']}像素{physical}，建议立即进行临床评估。")
+        elif level == 'medium':
+            diagnosis_summary.append(f"⚠️【中风险】检测到{label_mapping[tumor_type]}且病灶面积超过{thresholds['medium_risk']}像素{physical}，建议进一步检查。")
+        else:
+            diagnosis_summary.append(f"🟡【低风险】检测到较小的{label_mapping[tumor_type]}病灶，建议定期随访观察。")
+    
+    # 添加总体建议
+    if len(predictions) > 3:
+        diagnosis_summary.append("⚠️ 检测到多个病灶，可能存在广泛性病变，建议结合临床分析。")
+    elif len(predictions) > 1:
+        diagnosis_summary.append("🟡 检测到多发病灶，建议密切监测变化情况。")
+    
+    return diagnosis_summary
+
+
+class InferenceEngine:
+    '''模型推理与快速筛查，线程安全，可被 Flask 服务和桌面端共同使用'''
+
+    def __init__(self, registry, device):
+        self.registry = registry
+        self.device = device
+        # 快速筛查统计
+        self._triage_lock = threading.Lock()
+        self._triage_metrics = {
+            'total': 0,  # 筛查请求数
+            'fast_negative': 0,  # 快速返回阴性的数量
+            'escalated': 0,  # 升级为全分辨率复查的数量
+            'confirmed': 0,  # 复查后确认有目标的数量
+            'triage_time_total': 0.0,  # 快速筛查累计耗时（秒）
+            'full_time_total': 0.0,  # 全分辨率复查累计耗时（秒）
+        }
+
+    def analyze(self, img, conf_threshold=0.5, iou_threshold=0.7, mode='full', model_spec=None, pixel_spacing=None):
+        '''
+        完整的推理流程
+        :param mode: full（全分辨率分割）或 triage（快速筛查，有可疑目标时再全分辨率复查）
+        :param model_spec: 形如 "name" 或 "name:version"，为空使用默认模型
+        :param pixel_spacing: 输入图像的 [行间距, 列间距]（mm），用于计算病灶物理面积
+        :return: dict 或 None（无推理结果）；模型不存在时抛出 KeyError
+        '''
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        triage_path = None
+        if mode == 'triage':
+            result, model_entry, triage_path = self.run_triage(img, conf_threshold, iou_threshold, model_spec)
+        else:
+            result, model_entry = self.run_model(img, model_spec, conf_threshold, iou_threshold, FULL_IMGSZ)
+        if result is None:
+            return None
+
+        predictions = build_predictions(result)
+        masks_data = None
+        if hasattr(result, 'masks') and result.masks is not None:
+            masks_data = result.masks.data.cpu().numpy()
+            for pred, stats in zip(predictions, mask_statistics(masks_data, result.orig_shape, pixel_spacing)):
+                pred['mask_stats'] = stats
+        for pred in predictions:
+            pred['risk_level'] = risk_level(pred['original_label'], lesion_area(pred))
+        return {
+            'result': result,  # ultralytics 结果对象
+            'model_entry': model_entry,
+            'triage_path': triage_path,
+            'predictions': predictions,
+            'masks_data': masks_data,  # 模型分辨率的 mask (N, H, W)
+            'orig_shape': result.orig_shape,  # (高, 宽)
+            'diagnosis_summary': generate_diagnosis_summary(predictions),
+        }
+
+    def run_model(self, img, model_spec, conf, iou, imgsz):
+        '''
+        使用注册表中的模型进行一次预测
+        :return: (result 或 None, ModelEntry)
+        '''
+        model_entry = self.registry.acquire(model_spec)
+        try:
+            results = model_entry.model.predict(img,
+                                                conf=conf,
+                                                iou=iou,
+                                                device=self.device,
+                                                imgsz=imgsz)
+        finally:
+            self.registry.release(model_entry)
+        return (results[0] if results else None), model_entry
+
+    def run_triage(self, img, conf_threshold, iou_threshold, model_spec):
+        '''
+        快速筛查：先以小尺寸（或轻量模型）+ 低置信度阈值跑一遍，
+        没有任何可疑目标则直接返回，否则升级到全分辨率分割
+        :return: (result, ModelEntry, triage_path)
+        '''
+        triage_start = time.time()
+        result, model_entry = self.run_model(img, TRIAGE_MODEL or model_spec,
+                                             min(TRIAGE_CONF, conf_threshold), iou_threshold, TRIAGE_IMGSZ)
+        triage_time = time.time() - triage_start
+
+        if result is not None and len(result.boxes) == 0:
+            self._record_triage('fast_negative', triage_time)
+            return result, model_entry, 'fast_negative'
+
+        full_start = time.time()
+        result, model_entry = self.run_model(img, model_spec, conf_threshold, iou_threshold, FULL_IMGSZ)
+        confirmed = result is not None and len(result.boxes) > 0
+        self._record_triage('escalated', triage_time, time.time() - full_start, confirmed)
+        return result, model_entry, 'escalated'
+
+    def _record_triage(self, path, triage_time, full_time=0.0, confirmed=False):
+        with self._triage_lock:
+            self._triage_metrics['total'] += 1
+            self._triage_metrics[path] += 1
+            self._triage_metrics['triage_time_total'] += triage_time
+            self._triage_metrics['full_time_total'] += full_time
+            if confirmed:
+                self._triage_metrics['confirmed'] += 1
+
+    def triage_metrics(self):
+        with self._triage_lock:
+            metrics = dict(self._triage_metrics)
+        total = metrics['total']
+        metrics['escalation_rate'] = metrics['escalated'] / total if total else 0.0
+        metrics['confirm_rate'] = metrics['confirmed'] / metrics['escalated'] if metrics['escalated'] else 0.0
+        metrics['avg_time'] = (metrics['triage_time_total'] + metrics['full_time_total']) / total if total else 0.0
+        return metrics
+
+
+def create_engine(model_path=DEFAULT_MODEL_PATH, config_path=MODEL_CONFIG):
+    '''创建模型注册表并加载模型'''
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    registry = ModelRegistry(device, memory_budget_mb=MODEL_MEMORY_BUDGET_MB)
+    if config_path:
+        registry.load_config(config_path)
+    else:
+        registry.load('default', model_path)
+    return InferenceEngine(registry, device)
@@ -0,0 +1,420 @@
+'''
+监听目录的 DICOM 自动导入服务（无界面）
+
+扫描仪将 DICOM 导出到共享目录后，本服务自动：
+- 监听目录树（优先使用 watchdog/inotify，不可用时回退为轮询），按文件头识别 DICOM，不依赖扩展名
+- 按 StudyInstanceUID / SeriesInstanceUID 分组
+- 使用线程池并行调用后端 /predict 接口
+- 通过持久化索引跳过已处理的 SOPInstanceUID，重启后不会重复处理
+- 将结果 JSON 与标注图、Mask 写入输出目录（或输入文件旁边）
+
+用法:
+    python ingest.py /mnt/pacs_drop --output /data/results --workers 8
+'''
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pydicom as dicom
+import requests
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # 未安装 watchdog 时使用轮询
+    Observer = None
+    FileSystemEventHandler = object
+
+
+Server_URL = "http://localhost:5000"  # 后端服务地址
+DICOM_EXTENSIONS = ('.dcm',)  # 扩展名只用于上传时告知后端文件类型，识别 DICOM 以文件头为准
+IMAGE_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/webp': '.webp'}  # 按实际编码命名结果文件
+MAX_RETRIES = 3  # 处理失败的文件最多重试次数
+RETRY_BACKOFF = 30.0  # 首次重试前等待的秒数，之后每次翻倍
+
+
+class ProcessedIndex:
+    '''已处理实例的持久化索引（SQLite），保证重启后不重复处理'''
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS processed (
+                sop_uid TEXT PRIMARY KEY,
+                study_uid TEXT,
+                series_uid TEXT,
+                path TEXT,
+                status TEXT,
+                output TEXT,
+                error TEXT,
+                processed_at REAL
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_processed_series ON processed (series_uid)')
+        self._conn.commit()
+
+    def is_done(self, sop_uid):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM processed WHERE sop_uid = ? AND status = ?', (sop_uid, 'done')).fetchone()
+        return row is not None
+
+    def mark(self, sop_uid, study_uid, series_uid, path, status, output=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (sop_uid, study_uid, series_uid, path, status, output, error, time.time()))
+            self._conn.commit()
+
+    def series_results(self, series_uid):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT sop_uid, path, status, output FROM processed WHERE series_uid = ? ORDER BY path',
+                (series_uid,)).fetchall()
+        return [{'sop_uid': r[0], 'path': r[1], 'status': r[2], 'output': r[3]} for r in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def read_header(path):
+    '''只读取 DICOM 头信息（不解码像素）'''
+    ds = dicom.dcmread(path, stop_before_pixels=True, force=True)
+    return {
+        'sop_uid': str(ds.get('SOPInstanceUID', '')) or os.path.abspath(path),
+        'study_uid': str(ds.get('StudyInstanceUID', 'unknown_study')),
+        'series_uid': str(ds.get('SeriesInstanceUID', 'unknown_series')),
+    }
+
+
+def is_dicom(path):
+    '''DICOM Part 10 文件：128 字节前导之后是 "DICM"（扫描仪导出常见无扩展名或 .ima 等文件）'''
+    try:
+        with open(path, 'rb') as f:
+            f.seek(128)
+            return f.read(4) == b'DICM'
+    except OSError:
+        return False
+
+
+def atomic_write(path, data):
+    '''先写临时文件再改名，避免中断时留下不完整的结果'''
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class IngestService:
+    def __init__(self, watch_dir, output_dir=None, workers=4, poll_interval=5.0,
+                 settle_time=2.0, index_path=None, form_data=None, server_url=Server_URL,
+                 max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time  # 文件在该时间内未被修改才认为写入完成
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.server_url = server_url
+        self.form_data = form_data or {}
+        self.index = ProcessedIndex(index_path or os.path.join(self.output_dir or self.watch_dir, '.ingest_index.db'))
+
+        self._pending = queue.Queue()  # 待检查的文件路径
+        self._queued = set()  # 已在排队或处理中的路径
+        self._queued_lock = threading.Lock()
+        self._seen = {}  # 已处理文件路径 -> 修改时间
+        self._attempts = {}  # 处理失败的文件路径 -> 失败次数
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._series_pending = {}  # series_uid -> 未完成的文件数
+        self._series_lock = threading.Lock()
+
+    # ---------- 文件发现 ----------
+    def enqueue(self, path):
+        '''文件写入完成后才能读取文件头，是否为 DICOM 在调度时判断'''
+        if path.endswith('.tmp'):
+            return
+        with self._queued_lock:
+            if path in self._queued or self._seen.get(path) == self._mtime(path):
+                return
+            self._queued.add(path)
+        self._pending.put(path)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def _mark_seen(self, path):
+        '''记录已处理文件的修改时间，轮询时无需再读取其 DICOM 头'''
+        with self._queued_lock:
+            self._seen[path] = self._mtime(path)
+
+    def _retry_later(self, path):
+        '''
+        处理失败：先记为已见，避免轮询立即重新提交；按指数退避重新入队，超过重试次数后放弃
+        （文件被重新写入、修改时间变化后轮询仍会再次处理）
+        '''
+        with self._queued_lock:
+            attempts = self._attempts[path] = self._attempts.get(path, 0) + 1
+        self._mark_seen(path)
+        if attempts > self.max_retries:
+            print(f"放弃处理 {path}：已重试 {self.max_retries} 次")
+            return
+        timer = threading.Timer(self.retry_backoff * 2 ** (attempts - 1), self._retry, (path,))
+        timer.daemon = True
+        timer.start()
+
+    def _retry(self, path):
+        if self._stop.is_set():
+            return
+        with self._queued_lock:
+            self._seen.pop(path, None)
+        self.enqueue(path)
+
+    def scan(self):
+        '''全量扫描目录树（启动时及轮询模式下使用）'''
+        for root, _, files in os.walk(self.watch_dir):
+            if self.output_dir and os.path.abspath(root).startswith(self.output_dir):
+                continue
+            for name in files:
+                self.enqueue(os.path.join(root, name))
+
+    def _is_stable(self, path):
+        '''文件在 settle_time 内没有被修改，认为扫描仪已写完'''
+        try:
+            return time.time() - os.path.getmtime(path) >= self.settle_time
+        except OSError:
+            return False
+
+    # ---------- 分组与调度 ----------
+    def _dispatch_loop(self):
+        '''从待处理队列中取出文件，按序列分组后批量提交到线程池'''
+        while not self._stop.is_set():
+            batch = []
+            try:
+                batch.append(self._pending.get(timeout=1.0))
+                while True:
+                    batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                continue
+
+            groups = {}
+            deferred = []
+            for path in batch:
+                if not os.path.exists(path):
+                    self._release(path)
+                    continue
+                if not self._is_stable(path):
+                    deferred.append(path)
+                    continue
+                if not path.lower().endswith(DICOM_EXTENSIONS) and not is_dicom(path):
+                    self._mark_seen(path)  # 非 DICOM 文件在修改前不再检查
+                    self._release(path)
+                    continue
+                try:
+                    header = read_header(path)
+                except Exception as e:
+                    print(f"读取 DICOM 头失败 {path}: {e}")
+                    self._release(path)
+                    self._retry_later(path)
+                    continue
+                if self.index.is_done(header['sop_uid']):
+                    self._mark_seen(path)
+                    self._release(path)
+                    continue
+                key = (header['study_uid'], header['series_uid'])
+                groups.setdefault(key, []).append((path, header))
+
+            for (study_uid, series_uid), items in groups.items():
+                with self._series_lock:
+                    self._series_pending[series_uid] = self._series_pending.get(series_uid, 0) + len(items)
+                for path, header in sorted(items, key=lambda item: item[0]):
+                    self._pool.submit(self._process, path, header)
+
+            # 仍在写入的文件稍后重新检查
+            if deferred:
+                time.sleep(min(self.settle_time, 1.0))
+                for path in deferred:
+                    self._pending.put(path)
+
+    def _release(self, path):
+        with self._queued_lock:
+            self._queued.discard(path)
+
+    # ---------- 处理 ----------
+    def _session(self):
+        '''每个工作线程复用一个 keep-alive 连接'''
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _output_dir_for(self, path, header):
+        if self.output_dir:
+            out_dir = os.path.join(self.output_dir, header['study_uid'], header['series_uid'])
+        else:
+            out_dir = os.path.join(os.path.dirname(path), 'results')
+        os.makedirs(out_dir, exist_ok=True)
+        return out_dir
+
+    def _process(self, path, header):
+        sop_uid = header['sop_uid']
+        try:
+            session = self._session()
+            # 后端按扩展名识别 DICOM，无扩展名或 .ima 等文件上传时补上 .dcm
+            upload_name = os.path.basename(path)
+            if not upload_name.lower().endswith(DICOM_EXTENSIONS):
+                upload_name += DICOM_EXTENSIONS[0]
+            with open(path, 'rb') as f:
+                files = {'file': (upload_name, f)}
+                response = session.post(self.server_url + '/predict', files=files,
+                                        data=self.form_data, timeout=60 * 5)
+            if response.status_code != 200:
+                raise RuntimeError(f"服务器返回错误码：{response.status_code}")
+            result = response.json()
+
+            out_dir = self._output_dir_for(path, header)
+            base = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0])
+
+            # 标注图与各目标的 Mask（mask 固定请求 PNG，扩展名按 Content-Type 选择），任一下载失败都按处理失败重试
+            labeled = self._download(session, f"labeled_image/{result['labeled_image_id']}")
+            atomic_write(base + '_labeled' + self._extension(labeled), labeled.content)
+            for pred in result.get('predictions', []):
+                if pred.get('mask_id'):
+                    mask = self._download(session, f"image/{pred['mask_id']}", codec='png')
+                    atomic_write(f"{base}_mask_{pred['id']}" + self._extension(mask), mask.content)
+
+            result['source_path'] = path
+            result.update(header)
+            atomic_write(base + '.json', json.dumps(result, ensure_ascii=False, indent=2).encode('utf-8'))
+
+            # 结果全部落盘后再写索引，中途崩溃则重启后重新处理
+            self.index.mark(sop_uid, header['study_uid'], header['series_uid'], path, 'done', base + '.json')
+            self._mark_seen(path)
+            with self._queued_lock:
+                self._attempts.pop(path, None)
+            print(f"已处理: {path} ({result.get('total_detections', 0)} 个目标)")
+        except Exception as e:
+            print(f"处理失败 {path}: {e}")
+            self.index.mark(sop_uid, header['study_uid'], header['series_uid'], path, 'failed', error=str(e))
+            self._retry_later(path)
+        finally:
+            self._release(path)
+            self._finish_series(path, header)
+
+    def _download(self, session, endpoint, codec=None):
+        params = {'codec': codec} if codec else None
+        response = session.post(f"{self.server_url}/{endpoint}", params=params, timeout=60)
+        if response.status_code != 200:
+            raise RuntimeError(f"下载 {endpoint} 失败，服务器返回错误码：{response.status_code}")
+        return response
+
+    @staticmethod
+    def _extension(response):
+        return IMAGE_EXTENSIONS.get(response.headers.get('Content-Type', '').split(';')[0].strip(), '.png')
+
+    def _finish_series(self, path, header):
+        '''序列中本批文件全部处理完后写出序列汇总'''
+        series_uid = header['series_uid']
+        with self._series_lock:
+            self._series_pending[series_uid] -= 1
+            if self._series_pending[series_uid] > 0:
+                return
+            del self._series_pending[series_uid]
+        summary = {
+            'study_uid': header['study_uid'],
+            'series_uid': series_uid,
+            'instances': self.index.series_results(series_uid),
+        }
+        out_dir = self._output_dir_for(path, header)
+        atomic_write(os.path.join(out_dir, 'series_summary.json'),
+                     json.dumps(summary, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    # ---------- 运行 ----------
+    def run(self):
+        dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        dispatcher.start()
+        self.scan()  # 启动时先处理积压文件
+
+        observer = None
+        if Observer is not None:
+            observer = Observer()
+            observer.schedule(_DropHandler(self), self.watch_dir, recursive=True)
+            observer.start()
+            print(f"使用文件系统事件监听: {self.watch_dir}")
+        else:
+            print(f"未安装 watchdog，使用轮询监听: {self.watch_dir}")
+
+        try:
+            while not self._stop.is_set():
+                time.sleep(self.poll_interval)
+                if observer is None:
+                    self.scan()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            dispatcher.join()
+            self._pool.shutdown(wait=True)
+            self.index.close()
+
+
+class _DropHandler(FileSystemEventHandler):
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.service.enqueue(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.service.enqueue(event.dest_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='监听目录并自动处理 DICOM 影像')
+    parser.add_argument('watch_dir', help='监听的目录')
+    parser.add_argument('--output', help='结果输出目录，默认写到输入文件旁的 results 目录')
+    parser.add_argument('--server', default=Server_URL, help='后端服务地址')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='并行处理的线程数')
+    parser.add_argument('--index', help='已处理索引数据库路径')
+    parser.add_argument('--poll-interval', type=float, default=5.0, help='轮询间隔（秒）')
+    parser.add_argument('--retries', type=int, default=MAX_RETRIES, help='处理失败的文件最多重试次数')
+    parser.add_argument('--conf', type=float, default=0.5, help='置信度阈值')
+    parser.add_argument('--iou', type=float, default=0.7, help='交并比阈值')
+    parser.add_argument('--mode', default='full', help='推理模式：full / triage')
+    parser.add_argument('--model', help='使用的模型，形如 name 或 name:version')
+    args = parser.parse_args()
+
+    form_data = {'conf_threshold': args.conf, 'iou_threshold': args.iou, 'mode': args.mode}
+    if args.model:
+        form_data['model'] = args.model
+
+    service = IngestService(args.watch_dir, args.output, workers=args.workers,
+                            poll_interval=args.poll_interval, index_path=args.index,
+                            form_data=form_data, server_url=args.server, max_retries=args.retries)
+    service.run()
+
+
+if __name__ == '__main__':
+    main()
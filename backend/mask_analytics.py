@@ -0,0 +1,120 @@
+'''
+病灶 mask 统计：在模型分辨率上对全部 mask 一次性向量化计算，再按缩放比例换算到原图坐标
+模型输出的 mask 是 letterbox 后的网络输入尺寸（等比缩放并填充到步长的倍数），换算前先去掉填充
+- 像素面积、物理面积（mm²，需要 PixelSpacing）
+- 质心、周长、外接范围
+- 病灶之间的重叠（交集面积与 IoU）
+'''
+import cv2
+import numpy as np
+
+
+CV_MAX_CHANNELS = 512  # cv2.resize 单次可处理的最大通道数
+
+
+def letterbox_region(mask_shape, orig_shape):
+    '''
+    letterbox 图像中原图所在的区域（与 ultralytics.utils.ops.scale_masks 的计算一致）
+    :param mask_shape: 模型分辨率 (高, 宽)
+    :param orig_shape: 原图 (高, 宽)
+    :return: (top, bottom, left, right)
+    '''
+    mh, mw = mask_shape
+    orig_h, orig_w = orig_shape
+    gain = min(mh / orig_h, mw / orig_w)  # 原图 -> 网络输入的统一缩放比例
+    pad_w, pad_h = (mw - orig_w * gain) / 2, (mh - orig_h * gain) / 2  # 两侧各自的填充
+    top, left = int(round(pad_h - 0.1)), int(round(pad_w - 0.1))
+    bottom, right = mh - int(round(pad_h + 0.1)), mw - int(round(pad_w + 0.1))
+    return top, bottom, left, right
+
+
+def crop_letterbox(masks, orig_shape):
+    '''去掉 (N, H, W) mask 的 letterbox 填充'''
+    top, bottom, left, right = letterbox_region(masks.shape[1:], orig_shape)
+    return masks[:, top:bottom, left:right]
+
+
+def resize_masks(masks_data, orig_w, orig_h):
+    '''
+    将模型分辨率的全部 mask 去掉填充后一次缩放到原图尺寸（按通道批量缩放，而不是逐个调用 cv2.resize）
+    :param masks_data: (N, H, W) 0~1 数组
+    :return: (N, orig_h, orig_w) 0/255 的 uint8 数组
+    '''
+    masks = (crop_letterbox(np.asarray(masks_data), (orig_h, orig_w)) > 0.5).astype(np.uint8) * 255
+    resized = []
+    for start in range(0, len(masks), CV_MAX_CHANNELS):
+        chunk = np.ascontiguousarray(masks[start:start + CV_MAX_CHANNELS].transpose(1, 2, 0))
+        chunk = cv2.resize(chunk, (orig_w, orig_h), interpolation=cv2.INTER_NEAREST)
+        if chunk.ndim == 2:  # 单通道时 cv2 会去掉通道维
+            chunk = chunk[:, :, None]
+        resized.append(chunk.transpose(2, 0, 1))
+    if not resized:
+        return np.zeros((0, orig_h, orig_w), dtype=np.uint8)
+    return np.concatenate(resized)
+
+
+def mask_statistics(masks_data, orig_shape, pixel_spacing=None):
+    '''
+    :param masks_data: 模型分辨率的 mask (N, H, W)
+    :param orig_shape: 原图 (高, 宽)
+    :param pixel_spacing: 原图的 [行间距, 列间距]（mm），非 DICOM 时为 None
+    :return: 每个 mask 的统计 dict 列表，坐标与面积均为原图尺度
+    '''
+    masks = crop_letterbox(np.asarray(masks_data), orig_shape) > 0.5
+    count, height, width = masks.shape
+    if count == 0:
+        return []
+    orig_h, orig_w = orig_shape
+    sy, sx = orig_h / height, orig_w / width  # 去掉填充后的模型分辨率 -> 原图的缩放比例
+
+    # 面积与质心：行 / 列投影
+    row_sums = masks.sum(axis=2, dtype=np.int64)  # (N, H)
+    col_sums = masks.sum(axis=1, dtype=np.int64)  # (N, W)
+    area = row_sums.sum(axis=1)  # 模型分辨率下的像素数
+    safe_area = np.maximum(area, 1)
+    cy = row_sums @ (np.arange(height) + 0.5) / safe_area
+    cx = col_sums @ (np.arange(width) + 0.5) / safe_area
+
+    # 外接范围：投影中第一个 / 最后一个非零位置
+    rows_any, cols_any = row_sums > 0, col_sums > 0
+    y_min = rows_any.argmax(axis=1)
+    y_max = height - rows_any[:, ::-1].argmax(axis=1)
+    x_min = cols_any.argmax(axis=1)
+    x_max = width - cols_any[:, ::-1].argmax(axis=1)
+
+    # 周长：统计 mask 边界上的像素边，水平边与竖直边分别按列 / 行缩放
+    padded = np.pad(masks, ((0, 0), (1, 1), (1, 1)))
+    horizontal_edges = (padded[:, 1:, :] != padded[:, :-1, :]).sum(axis=(1, 2))
+    vertical_edges = (padded[:, :, 1:] != padded[:, :, :-1]).sum(axis=(1, 2))
+
+    # 病灶之间的重叠：一次矩阵乘法得到两两交集
+    flat = masks.reshape(count, -1).astype(np.float32)
+    intersection = flat @ flat.T
+    union = area[:, None] + area[None, :] - intersection
+    iou = np.divide(intersection, union, out=np.zeros(union.shape), where=union > 0)
+
+    pixel_area = sx * sy
+    if pixel_spacing:
+        row_mm, col_mm = pixel_spacing
+        physical_area = area * pixel_area * row_mm * col_mm
+        physical_perimeter = horizontal_edges * sx * col_mm + vertical_edges * sy * row_mm
+    else:
+        physical_area = physical_perimeter = None
+
+    stats = []
+    for i in range(count):
+        overlaps = [{'id': int(j) + 1,
+                     'area': float(intersection[i, j] * pixel_area),
+                     'iou': float(iou[i, j])}
+                    for j in np.flatnonzero(intersection[i] > 0) if j != i]
+        stats.append({
+            'area': float(area[i] * pixel_area),  # 像素面积（原图）
+            'physical_area': float(physical_area[i]) if physical_area is not None else None,  # mm²
+            'centroid': [float(cx[i] * sx), float(cy[i] * sy)],  # [x, y]
+            'perimeter': float(horizontal_edges[i] * sx + vertical_edges[i] * sy),  # 像素
+            'physical_perimeter': float(physical_perimeter[i]) if physical_perimeter is not None else None,  # mm
+            'extent': [float(x_min[i] * sx), float(y_min[i] * sy),
+                       float(x_max[i] * sx), float(y_max[i] * sy)] if area[i] else None,  # [x1, y1, x2, y2]
+            'overlaps': overlaps,  # 与其他病灶的重叠
+        })
+    return stats
@@ -0,0 +1,221 @@
+'''
+内存统计与 RSS 看门狗
+- 汇总各缓存的字节数（按缓存、按条目类别）与最大的条目
+- tracemalloc 分配位置统计（TRACEMALLOC_FRAMES > 0 时启用）
+- 分配器统计：glibc malloc（torch CPU 张量同样经由 malloc 分配，包含在内）与 torch CUDA 缓存分配器
+- 定期采样进程 RSS；超过软上限时按顺序清理缓存并把空闲内存归还给系统，避免进程被 OOM 杀掉
+'''
+import ctypes
+import ctypes.util
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+try:
+    import psutil
+except ImportError:  # 未安装 psutil 时从 /proc 读取
+    psutil = None
+
+
+MEMORY_SOFT_LIMIT_MB = int(os.environ.get('MEMORY_SOFT_LIMIT_MB', 0))  # RSS 软上限，0 表示不启用清理
+MEMORY_CHECK_INTERVAL = float(os.environ.get('MEMORY_CHECK_INTERVAL', 10))  # RSS 采样间隔（秒）
+MEMORY_HISTORY_SIZE = int(os.environ.get('MEMORY_HISTORY_SIZE', 360))  # 保留的 RSS 采样数
+MEMORY_SHED_FRACTION = float(os.environ.get('MEMORY_SHED_FRACTION', 0.5))  # 每次清理各缓存的比例
+TRACEMALLOC_FRAMES = int(os.environ.get('TRACEMALLOC_FRAMES', 0))  # tracemalloc 记录的调用栈深度，0 表示不启用
+
+
+def current_rss():
+    '''当前进程的 RSS（字节）'''
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # 峰值，Linux 单位为 KB
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_size_t) for name in
+                ('arena', 'ordblks', 'smblks', 'hblks', 'hblkhd', 'usmblks', 'fsmblks', 'uordblks', 'fordblks',
+                 'keepcost')]
+
+
+def _libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+    except OSError:
+        return None
+
+
+_LIBC = _libc()
+
+
+def malloc_stats():
+    '''glibc 堆统计：in_use 为已分配，free 为堆内空闲（碎片），mmap 为大块直接映射'''
+    if _LIBC is None or not hasattr(_LIBC, 'mallinfo2'):
+        return None
+    _LIBC.mallinfo2.restype = _MallInfo2
+    info = _LIBC.mallinfo2()
+    heap = info.arena
+    return {
+        'heap_bytes': heap,
+        'in_use_bytes': info.uordblks,
+        'free_bytes': info.fordblks,
+        'mmap_bytes': info.hblkhd,
+        'fragmentation': info.fordblks / heap if heap else 0.0,
+    }
+
+
+def malloc_trim():
+    '''把堆中空闲的内存归还给系统'''
+    if _LIBC is not None and hasattr(_LIBC, 'malloc_trim'):
+        _LIBC.malloc_trim(0)
+
+
+def cuda_stats():
+    '''torch CUDA 缓存分配器统计，未加载 torch 或没有 GPU 时返回 None'''
+    torch = sys.modules.get('torch')  # 不为统计而导入 torch
+    if torch is None or not torch.cuda.is_available():
+        return None
+    stats = torch.cuda.memory_stats()
+    return {
+        'allocated_bytes': stats.get('allocated_bytes.all.current', 0),
+        'peak_allocated_bytes': stats.get('allocated_bytes.all.peak', 0),
+        'reserved_bytes': stats.get('reserved_bytes.all.current', 0),
+        'inactive_split_bytes': stats.get('inactive_split_bytes.all.current', 0),  # 缓存块内的碎片
+        'alloc_retries': stats.get('num_alloc_retries', 0),  # 因显存不足释放缓存后重试的次数
+        'ooms': stats.get('num_ooms', 0),
+    }
+
+
+def allocator_stats():
+    '''
+    分配器统计
+    - malloc：glibc 堆，torch CPU 张量同样经由 malloc 分配，已包含在内（torch 不单独提供 CPU 统计）
+    - cuda：torch CUDA 缓存分配器
+    '''
+    return {'malloc': malloc_stats(), 'cuda': cuda_stats()}
+
+
+def tracemalloc_top(limit=10):
+    '''tracemalloc 分配最多的代码位置，未启用时返回 None'''
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+    ))
+    traced, peak = tracemalloc.get_traced_memory()
+    return {
+        'traced_bytes': traced,
+        'peak_bytes': peak,
+        'top': [{'location': str(stat.traceback), 'bytes': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics('lineno')[:limit]],
+    }
+
+
+def summarize(items, top=10):
+    '''
+    汇总缓存条目
+    :param items: [(key, 类别, 字节数)]
+    '''
+    by_class = {}
+    total = 0
+    for _, entry_class, nbytes in items:
+        stat = by_class.setdefault(entry_class, {'entries': 0, 'bytes': 0})
+        stat['entries'] += 1
+        stat['bytes'] += nbytes
+        total += nbytes
+    largest = sorted(items, key=lambda item: item[2], reverse=True)[:top]
+    return {
+        'entries': len(items),
+        'bytes': total,
+        'by_class': by_class,
+        'largest': [{'key': str(key), 'class': entry_class, 'bytes': nbytes} for key, entry_class, nbytes in largest],
+    }
+
+
+class MemoryMonitor:
+    '''
+    内存统计与看门狗
+    caches 为 [(名称, 缓存对象)]，缓存对象需提供 memory_items()，可清理的缓存另提供 shed(fraction)；
+    超过软上限时按列表顺序清理，直到 RSS 回到上限以下
+    '''
+
+    def __init__(self, caches, soft_limit_mb=MEMORY_SOFT_LIMIT_MB, interval=MEMORY_CHECK_INTERVAL,
+                 history_size=MEMORY_HISTORY_SIZE, shed_fraction=MEMORY_SHED_FRACTION):
+        self.caches = caches
+        self.soft_limit = soft_limit_mb * 1024 * 1024
+        self.interval = interval
+        self.shed_fraction = shed_fraction
+        self.history = deque(maxlen=history_size)  # [(时间戳, RSS)]
+        self.shed_events = deque(maxlen=50)  # 最近的清理记录
+        self._lock = threading.Lock()
+        if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                print(f"❌ 内存检查失败: {e}")
+            time.sleep(self.interval)
+
+    def check(self):
+        '''采样 RSS，超过软上限时清理缓存'''
+        rss = current_rss()
+        with self._lock:
+            self.history.append((time.time(), rss))
+        if self.soft_limit and rss > self.soft_limit:
+            self.shed(rss)
+
+    def shed(self, rss):
+        freed = {}
+        for name, cache in self.caches:
+            if not hasattr(cache, 'shed'):
+                continue
+            freed[name] = cache.shed(self.shed_fraction)
+            malloc_trim()
+            rss_after = current_rss()
+            if rss_after <= self.soft_limit:
+                break
+        else:
+            rss_after = current_rss()
+        event = {'time': time.time(), 'rss_before': rss, 'rss_after': rss_after, 'freed': freed}
+        with self._lock:
+            self.shed_events.append(event)
+        print(f"⚠️ RSS {rss / 1024 / 1024:.0f} MB 超过软上限，已清理缓存: {freed}，"
+              f"清理后 {rss_after / 1024 / 1024:.0f} MB")
+
+    def report(self, top=10):
+        caches = {}
+        all_items = []
+        for name, cache in self.caches:
+            items = cache.memory_items()
+            caches[name] = summarize(items, top)
+            all_items += [(f"{name}:{key}", entry_class, nbytes) for key, entry_class, nbytes in items]
+        with self._lock:
+            history = [{'time': t, 'rss_bytes': rss} for t, rss in self.history]
+            shed_events = list(self.shed_events)
+        return {
+            'rss_bytes': current_rss(),
+            'soft_limit_bytes': self.soft_limit or None,
+            'rss_history': history,
+            'caches': caches,
+            'cached_bytes': sum(cache['bytes'] for cache in caches.values()),
+            'largest': summarize(all_items, top)['largest'],
+            'allocator': allocator_stats(),
+            'tracemalloc': tracemalloc_top(top),
+            'shed_events': shed_events,
+        }
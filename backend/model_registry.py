@@ -0,0 +1,239 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from ultralytics import YOLO
+
+
+class ModelEntry:
+    '''已加载模型的一条记录'''
+
+    def __init__(self, name, version, path, model, size_bytes):
+        self.name = name  # 模型名称
+        self.version = version  # 模型版本（默认取权重文件摘要）
+        self.path = path  # 权重文件路径
+        self.model = model  # YOLO 模型对象
+        self.size_bytes = size_bytes  # 参数占用的字节数
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.in_use = 0  # 正在使用该模型的请求数
+
+    @property
+    def key(self):
+        return f"{self.name}:{self.version}"
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'path': self.path,
+            'size_mb': round(self.size_bytes / 1024 / 1024, 2),
+            'loaded_at': self.loaded_at,
+            'last_used': self.last_used,
+            'in_use': self.in_use,
+        }
+
+
+def file_version(path):
+    '''根据权重文件内容计算版本号'''
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()[:12]
+
+
+def model_size_bytes(model):
+    '''估算模型参数占用的内存'''
+    try:
+        return sum(p.numel() * p.element_size() for p in model.model.parameters())
+    except Exception:
+        return 0
+
+
+class ModelRegistry:
+    '''
+    模型注册表：同时加载多个命名、带版本的模型
+    - 每个名称有一个当前默认版本，可在后台加载并预热后原子切换
+    - 超出内存预算时按最近最少使用淘汰空闲模型
+    '''
+
+    def __init__(self, device, memory_budget_mb=4096, warmup_imgsz=640):
+        self.device = device
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.warmup_imgsz = warmup_imgsz
+        self._lock = threading.RLock()
+        self._entries = {}  # "name:version" -> ModelEntry
+        self._current = {}  # name -> 当前默认版本
+        self._loading = {}  # "name:version" -> 后台加载线程
+        self._inflight = {}  # "name:version" -> 正在加载的 Future，同一模型并发加载时只加载一次
+        self.default_name = None
+
+    def load(self, name, path, version=None, make_default=True):
+        '''同步加载并预热模型，完成后再登记，保证切换是原子的'''
+        version = version or file_version(path)
+        key = f"{name}:{version}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if make_default:
+                    self._set_default(name, version)
+                return entry
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            entry = future.result()
+            if make_default:
+                with self._lock:
+                    self._set_default(name, version)
+            return entry
+
+        try:
+            model = YOLO(path)
+            self._warmup(model)
+            entry = ModelEntry(name, version, path, model, model_size_bytes(model))
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._entries[key] = entry
+            if make_default or name not in self._current:
+                self._set_default(name, version)
+            self._evict_if_needed()
+        future.set_result(entry)
+        print(f"模型已加载: {key} ({entry.to_dict()['size_mb']} MB)")
+        return entry
+
+    def load_async(self, name, path, version=None, make_default=True):
+        '''在后台线程中加载模型（版本摘要也在后台计算），返回加载任务的 key'''
+        key = f"{name}:{version}" if version else f"{name}:{path}"
+        with self._lock:
+            thread = self._loading.get(key)
+            if thread is not None and thread.is_alive():
+                return key
+
+            def worker():
+                try:
+                    self.load(name, path, version, make_default)
+                except Exception as e:
+                    print(f"模型加载失败 {key}: {e}")
+                finally:
+                    with self._lock:
+                        self._loading.pop(key, None)
+
+            thread = threading.Thread(target=worker, daemon=True)
+            self._loading[key] = thread
+            thread.start()
+        return key
+
+    def _warmup(self, model):
+        dummy = np.zeros((self.warmup_imgsz, self.warmup_imgsz, 3), dtype=np.uint8)
+        model.predict(dummy, device=self.device, imgsz=self.warmup_imgsz, verbose=False)
+
+    def _set_default(self, name, version):
+        self._current[name] = version
+        if self.default_name is None:
+            self.default_name = name
+
+    def set_default_name(self, name):
+        with self._lock:
+            if name not in self._current:
+                raise KeyError(name)
+            self.default_name = name
+
+    def resolve(self, spec=None):
+        '''
+        解析模型选择，spec 形如 "name" 或 "name:version"，为空时使用默认模型
+        :return: ModelEntry
+        '''
+        with self._lock:
+            if not spec:
+                spec = self.default_name
+            if spec is None:
+                raise KeyError('no model loaded')
+            if ':' in spec:
+                entry = self._entries.get(spec)
+            else:
+                version = self._current.get(spec)
+                entry = self._entries.get(f"{spec}:{version}") if version else None
+            if entry is None:
+                raise KeyError(spec)
+            return entry
+
+    def acquire(self, spec=None):
+        '''获取模型并标记为使用中，使用完后需调用 release'''
+        with self._lock:
+            entry = self.resolve(spec)
+            entry.in_use += 1
+            entry.last_used = time.time()
+            return entry
+
+    def release(self, entry):
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.time()
+            self._evict_if_needed()
+
+    def unload(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                raise KeyError(key)
+            if self._is_pinned(entry):
+                raise ValueError(f"模型 {key} 正在使用或为当前默认版本")
+            del self._entries[key]
+
+    def _is_pinned(self, entry):
+        return entry.in_use > 0 or self._current.get(entry.name) == entry.version
+
+    def _evict_if_needed(self):
+        '''超出内存预算时，按最近使用时间淘汰空闲、非默认的模型'''
+        total = sum(e.size_bytes for e in self._entries.values())
+        if total <= self.memory_budget:
+            return
+        candidates = sorted(
+            (e for e in self._entries.values() if not self._is_pinned(e)),
+            key=lambda e: e.last_used)
+        for entry in candidates:
+            if total <= self.memory_budget:
+                break
+            del self._entries[entry.key]
+            total -= entry.size_bytes
+            print(f"模型已淘汰: {entry.key}")
+
+    def memory_items(self):
+        '''内存统计：(key, 类别, 字节数)'''
+        with self._lock:
+            return [(key, 'model', entry.size_bytes) for key, entry in self._entries.items()]
+
+    def list_models(self):
+        with self._lock:
+            return {
+                'default': self.default_name,
+                'current': dict(self._current),
+                'loading': list(self._loading),
+                'models': [e.to_dict() for e in self._entries.values()],
+                'memory_budget_mb': self.memory_budget // (1024 * 1024),
+            }
+
+    def load_config(self, config_path):
+        '''
+        从 JSON 配置加载模型，格式:
+        {"default": "yolo", "models": [{"name": "yolo", "path": "./model.pt", "version": "v1"}]}
+        '''
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        for item in config.get('models', []):
+            self.load(item['name'], item['path'], item.get('version'),
+                      make_default=item.get('default', True))
+        if config.get('default'):
+            self.set_default_name(config['default'])
@@ -0,0 +1,197 @@
+import gzip
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+try:
+    import zstandard
+except ImportError:  # 未安装 zstandard 时只支持 gzip
+    zstandard = None
+
+
+# 图像编码配置（可按部署调整）
+ENCODE_WORKERS = int(os.environ.get('ENCODE_WORKERS', 4))  # 编码线程数
+IMAGE_CODEC = os.environ.get('IMAGE_CODEC', 'auto')  # 原图/标注图默认编码：auto（沿用上传格式）/ png / jpeg / webp
+MASK_CODEC = os.environ.get('MASK_CODEC', 'png')  # mask 默认编码：png / png1 / packbits
+PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', 6))
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', 95))
+WEBP_QUALITY = int(os.environ.get('WEBP_QUALITY', 90))
+JSON_COMPRESS_MIN_BYTES = 1024  # 小于该大小的 JSON 不压缩
+
+IMAGE_MIMETYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+
+# 编码线程池：图像编码不占用请求线程
+encode_pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS)
+
+
+def resolve(data):
+    '''缓存中的数据可能是尚未完成的编码任务'''
+    if isinstance(data, Future):
+        return data.result()
+    return data
+
+
+def split_future(future, count):
+    '''将返回列表的任务拆分为 count 个 Future，按位置取各自的结果'''
+    parts = [Future() for _ in range(count)]
+
+    def done(f):
+        if f.exception() is not None:
+            for part in parts:
+                part.set_exception(f.exception())
+        else:
+            for part, value in zip(parts, f.result()):
+                part.set_result(value)
+
+    future.add_done_callback(done)
+    return parts
+
+
+def encode_image(img, codec='png', quality=None, lossless=False, compress_level=None):
+    '''
+    按指定编码压缩图像
+    :param img: PIL 图像或 RGB numpy 数组
+    :return: (bytes, mimetype)
+    '''
+    if isinstance(img, np.ndarray):
+        img = Image.fromarray(img)
+    buffer = io.BytesIO()
+    if codec == 'jpeg':
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        img.save(buffer, format='JPEG', quality=quality or JPEG_QUALITY)
+    elif codec == 'webp':
+        if lossless:
+            img.save(buffer, format='WEBP', lossless=True, quality=100, method=4)
+        else:
+            img.save(buffer, format='WEBP', quality=quality or WEBP_QUALITY)
+    elif codec == 'png':
+        level = PNG_COMPRESS_LEVEL if compress_level is None else compress_level
+        img.save(buffer, format='PNG', compress_level=level)
+    else:
+        raise ValueError(f'Unsupported image codec: {codec}')
+    return buffer.getvalue(), IMAGE_MIMETYPES[codec]
+
+
+def reencode_image(data, codec, **options):
+    '''将已编码的图像转为其他编码'''
+    return encode_image(Image.open(io.BytesIO(data)), codec, **options)
+
+
+def pack_mask(mask):
+    '''mask 按位压缩保存（每像素 1 bit）'''
+    mask = np.asarray(mask) > 0
+    return {'bits': np.packbits(mask, axis=None).tobytes(), 'shape': mask.shape}
+
+
+def unpack_mask(packed):
+    height, width = packed['shape']
+    bits = np.frombuffer(packed['bits'], dtype=np.uint8)
+    return np.unpackbits(bits, count=height * width).reshape(height, width).astype(bool)
+
+
+def encode_mask(packed, codec='png', compress_level=None):
+    '''
+    mask 编码：
+    - png: 8 位灰度 PNG（兼容旧客户端）
+    - png1: 1 位 PNG
+    - packbits: 原始按位数据，尺寸见响应头 X-Mask-Shape
+    :return: (bytes, mimetype)
+    '''
+    if codec == 'packbits':
+        return packed['bits'], 'application/octet-stream'
+    mask = unpack_mask(packed)
+    level = PNG_COMPRESS_LEVEL if compress_level is None else compress_level
+    buffer = io.BytesIO()
+    if codec == 'png1':
+        Image.fromarray(mask).convert('1').save(buffer, format='PNG', compress_level=level)
+    elif codec == 'png':
+        Image.fromarray(mask.astype(np.uint8) * 255).save(buffer, format='PNG', compress_level=level)
+    else:
+        raise ValueError(f'Unsupported mask codec: {codec}')
+    return buffer.getvalue(), 'image/png'
+
+
+def image_options(args, accept=''):
+    '''
+    从请求参数解析图像编码选项：?codec=webp&lossless=1&quality=80&compress_level=9
+    未指定 codec 且客户端接受 webp 时使用无损 webp
+    :return: (codec 或 None, 选项 dict)
+    '''
+    codec = args.get('codec')
+    options = {}
+    if args.get('quality'):
+        options['quality'] = int(args['quality'])
+    if args.get('compress_level'):
+        options['compress_level'] = int(args['compress_level'])
+    if args.get('lossless'):
+        options['lossless'] = args['lossless'].lower() in ('1', 'true')
+    if codec is None and 'image/webp' in accept:
+        codec = 'webp'
+        options.setdefault('lossless', True)
+    return codec, options
+
+
+def compress_json(body, accept_encoding):
+    '''
+    按 Accept-Encoding 压缩 JSON 响应
+    :return: (body, content-encoding 或 None)
+    '''
+    if len(body) < JSON_COMPRESS_MIN_BYTES:
+        return body, None
+    accept_encoding = accept_encoding.lower()
+    if zstandard is not None and 'zstd' in accept_encoding:
+        return zstandard.ZstdCompressor(level=3).compress(body), 'zstd'
+    if 'gzip' in accept_encoding:
+        return gzip.compress(body, compresslevel=6), 'gzip'
+    return body, None
+
+
+class EncodedCache:
+    '''非默认编码结果的 LRU 缓存，同一 ID 同一编码只转换一次'''
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def memory_items(self):
+        '''内存统计：(key, 类别, 字节数)'''
+        with self._lock:
+            return [(key, f'encoded {mimetype}', len(data)) for key, (data, mimetype) in self._items.items()]
+
+    def shed(self, fraction):
+        '''按 LRU 顺序丢弃一部分条目，返回释放的字节数'''
+        freed = 0
+        with self._lock:
+            for _ in range(min(len(self._items), max(1, int(len(self._items) * fraction)))):
+                _, (data, _) = self._items.popitem(last=False)
+                freed += len(data)
+        return freed
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,261 @@
+'''
+共享结果层：/predict 生成的原图、标注图、mask 与预测结果
+- MemoryStore：进程内存储（单节点部署，默认）
+- DiskStore：本地或共享磁盘目录（同机多进程、NFS）
+- RedisStore：Redis 协议的键值服务（多节点部署，redis / valkey 等均可）
+
+资源 ID 形如 "<节点>.<uuid>"，负载均衡器或其他节点可以据此把请求路由到生成该资源的节点
+'''
+import json
+import os
+import re
+import socket
+import struct
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+try:
+    import redis
+except ImportError:  # 未安装 redis 时不能使用 RedisStore
+    redis = None
+
+
+RESULT_STORE = os.environ.get('RESULT_STORE', 'memory')  # memory / disk / redis
+RESULT_STORE_DIR = os.environ.get('RESULT_STORE_DIR', './result_store')  # DiskStore 目录
+RESULT_STORE_URL = os.environ.get('RESULT_STORE_URL', 'redis://localhost:6379/0')  # RedisStore 地址
+RESULT_TTL = int(os.environ.get('RESULT_TTL', 60 * 60))  # 结果保留时间（秒）
+
+# 当前节点 ID 与其他节点地址（NODE_ADDRESSES="node1=http://10.0.0.1:5000,node2=http://10.0.0.2:5000"）
+NODE_ID = re.sub(r'[^A-Za-z0-9_]', '_', os.environ.get('NODE_ID') or socket.gethostname())
+NODE_ADDRESSES = dict(item.split('=', 1) for item in os.environ.get('NODE_ADDRESSES', '').split(',') if '=' in item)
+
+_ID_PATTERN = re.compile(r'^[A-Za-z0-9_]+\.[0-9a-f-]{36}$')
+
+
+def new_id():
+    '''生成带节点前缀的资源 ID'''
+    return f"{NODE_ID}.{uuid.uuid4()}"
+
+
+def node_of(resource_id):
+    '''资源 ID 所属的节点，旧格式的 ID 返回 None'''
+    if not _ID_PATTERN.match(resource_id):
+        return None
+    return resource_id.split('.', 1)[0]
+
+
+def dump_entry(entry):
+    '''
+    缓存条目序列化：4 字节头长度 + JSON 头 + 原始数据
+    data 可以是编码后的图像 (bytes, mimetype)、按位压缩的 mask {'bits', 'shape'} 或可 JSON 化的对象
+    '''
+    meta = {key: value for key, value in entry.items() if key != 'data'}
+    data = entry['data']
+    if isinstance(data, tuple):
+        payload, meta['mimetype'] = data
+    elif isinstance(data, dict) and 'bits' in data:
+        payload, meta['shape'] = data['bits'], list(data['shape'])
+    else:
+        payload, meta['json'] = json.dumps(data, ensure_ascii=False).encode('utf-8'), True
+    header = json.dumps(meta).encode('utf-8')
+    return struct.pack('>I', len(header)) + header + payload
+
+
+def entry_nbytes(entry):
+    '''条目数据占用的字节数（编码尚未完成的条目为 0）'''
+    data = entry['data']
+    if isinstance(data, tuple):
+        return len(data[0])
+    if isinstance(data, dict) and 'bits' in data:
+        return len(data['bits'])
+    if isinstance(data, Future):
+        return 0
+    return len(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+
+def load_entry(blob):
+    (header_len,) = struct.unpack('>I', blob[:4])
+    entry = json.loads(blob[4:4 + header_len].decode('utf-8'))
+    payload = blob[4 + header_len:]
+    if 'mimetype' in entry:
+        entry['data'] = (payload, entry.pop('mimetype'))
+    elif 'shape' in entry:
+        entry['data'] = {'bits': payload, 'shape': tuple(entry.pop('shape'))}
+    else:
+        entry.pop('json', None)
+        entry['data'] = json.loads(payload.decode('utf-8'))
+    return entry
+
+
+class ResultStore:
+    '''
+    结果存储接口
+    - put 的 data 可以是尚未完成的编码任务（Future），完成前只有本节点可以读取，完成后写入存储
+    - get 返回的条目中 data 可能仍是 Future，调用方用 payload_codecs.resolve 取值
+    '''
+
+    def __init__(self):
+        self._pending = {}  # (类型, ID) -> 编码尚未完成的条目
+        self._held = {}  # (类型, ID) -> 编码任务持有的输入数据字节数（图像、推理结果张量）
+        self._lock = threading.Lock()
+
+    def put(self, kind, resource_id, entry, held_bytes=0):
+        '''
+        :param held_bytes: 编码任务完成前持有的输入数据大小，用于内存统计
+        '''
+        data = entry['data']
+        if isinstance(data, Future):
+            with self._lock:
+                self._pending[(kind, resource_id)] = entry
+                self._held[(kind, resource_id)] = held_bytes
+            data.add_done_callback(lambda future: self._complete(kind, resource_id, entry, future))
+        else:
+            self._write(kind, resource_id, entry)
+
+    def get(self, kind, resource_id):
+        with self._lock:
+            entry = self._pending.get((kind, resource_id))
+        if entry is not None:
+            return entry
+        return self._read(kind, resource_id)
+
+    def expire(self):
+        '''清理过期结果（由后台线程定期调用）'''
+
+    def memory_items(self):
+        '''本进程内存中的条目：(key, 类别, 字节数)，编码中的条目按其持有的输入数据计算'''
+        with self._lock:
+            return [(resource_id, f'{kind} (encoding)', self._held.get((kind, resource_id), 0))
+                    for kind, resource_id in self._pending]
+
+    def shed(self, fraction):
+        '''内存紧张时丢弃一部分结果，返回释放的字节数（存储不在本进程内存中时不做处理）'''
+        return 0
+
+    def _complete(self, kind, resource_id, entry, future):
+        try:
+            if future.exception() is None:
+                self._write(kind, resource_id, dict(entry, data=future.result()))
+            else:
+                print(f"❌ 编码失败 {kind} {resource_id}: {future.exception()}")
+        except Exception as e:
+            print(f"❌ 写入结果失败 {kind} {resource_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.pop((kind, resource_id), None)
+                self._held.pop((kind, resource_id), None)
+
+    def _write(self, kind, resource_id, entry):
+        raise NotImplementedError
+
+    def _read(self, kind, resource_id):
+        raise NotImplementedError
+
+
+class MemoryStore(ResultStore):
+    '''进程内存储，只能由生成结果的进程读取；每次 expire 清空全部结果'''
+
+    def __init__(self):
+        super().__init__()
+        self._items = {}
+
+    def _write(self, kind, resource_id, entry):
+        self._items[(kind, resource_id)] = entry
+
+    def _read(self, kind, resource_id):
+        return self._items.get((kind, resource_id))
+
+    def expire(self):
+        self._items.clear()
+
+    def memory_items(self):
+        items = super().memory_items()
+        items += [(resource_id, kind, entry_nbytes(entry)) for (kind, resource_id), entry in list(self._items.items())]
+        return items
+
+    def shed(self, fraction):
+        '''按写入顺序丢弃最早的一部分结果'''
+        keys = list(self._items)
+        freed = 0
+        for key in keys[:max(1, int(len(keys) * fraction))]:
+            entry = self._items.pop(key, None)
+            if entry is not None:
+                freed += entry_nbytes(entry)
+        return freed
+
+
+class DiskStore(ResultStore):
+    '''磁盘存储：每个条目一个文件，原子写入，按修改时间过期'''
+
+    def __init__(self, root=RESULT_STORE_DIR, ttl=RESULT_TTL):
+        super().__init__()
+        self.root = root
+        self.ttl = ttl
+
+    def _path(self, kind, resource_id):
+        if not re.fullmatch(r'[A-Za-z0-9_.-]+', resource_id):
+            return None  # 防止路径穿越
+        return os.path.join(self.root, kind, resource_id[-2:], resource_id)
+
+    def _write(self, kind, resource_id, entry):
+        path = self._path(kind, resource_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(dump_entry(entry))
+        os.replace(tmp_path, path)
+
+    def _read(self, kind, resource_id):
+        path = self._path(kind, resource_id)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return load_entry(f.read())
+        except FileNotFoundError:
+            return None
+
+    def expire(self):
+        deadline = time.time() - self.ttl
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.path.getmtime(path) < deadline:
+                        os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+class RedisStore(ResultStore):
+    '''Redis 协议的键值存储，过期由服务端 TTL 处理'''
+
+    def __init__(self, url=RESULT_STORE_URL, ttl=RESULT_TTL, prefix='brain_tumour'):
+        super().__init__()
+        if redis is None:
+            raise RuntimeError('RedisStore requires the redis package')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, kind, resource_id):
+        return f"{self.prefix}:{kind}:{resource_id}"
+
+    def _write(self, kind, resource_id, entry):
+        self.client.set(self._key(kind, resource_id), dump_entry(entry), ex=self.ttl)
+
+    def _read(self, kind, resource_id):
+        blob = self.client.get(self._key(kind, resource_id))
+        return load_entry(blob) if blob is not None else None
+
+
+def create_store(kind=RESULT_STORE):
+    if kind == 'memory':
+        return MemoryStore()
+    if kind == 'disk':
+        return DiskStore()
+    if kind == 'redis':
+        return RedisStore()
+    raise ValueError(f'Unknown result store: {kind}')
@@ -0,0 +1,352 @@
+import functools
+import hmac
+import threading
+import time
+from flask import Flask, request, jsonify, send_file, make_response, redirect
+from flask_cors import CORS
+import io
+import os
+
+from dicom_decode import pixel_decoder
+from dicom_index import DicomIndex
+from engine import UnsupportedFormatError, create_engine, load_image, render_labeled, result_nbytes
+from mask_analytics import resize_masks
+from memory_monitor import MemoryMonitor
+from payload_codecs import (IMAGE_CODEC, MASK_CODEC, EncodedCache, compress_json, encode_image,
+                            encode_mask, encode_pool, image_options, pack_mask, reencode_image, resolve,
+                            split_future)
+from result_store import NODE_ADDRESSES, NODE_ID, create_store, new_id, node_of
+
+# 初始化 Flask 应用
+app = Flask(__name__)
+# 设置 CORS 允许的跨域请求
+# CORS(app, resources={r"/*": {"origins": "http://your-hospital-domain.com"}})
+CORS(app)
+# 设置 JSONIFY 最大响应体大小
+app.config['JSONIFY_MAX_SIZE'] = 10 * 1024 * 1024  # 设置为 10MB
+
+# 结果存储：原图（image）、带检测框和标签的图像（labeled_image）、mask、预测数据（prediction）
+# 通过 RESULT_STORE 选择进程内 / 磁盘 / Redis 存储，多节点部署时任一节点都可以返回结果
+result_store = create_store()
+encoded_cache = EncodedCache()  # 非默认编码的图像 / mask 缓存
+
+# DICOM 元数据索引（检查/序列/实例检索与去重）
+# 索引是本节点的 SQLite 文件，与筛查统计一样不在共享结果层中：多节点部署时这些查询只反映本节点处理过的数据，
+# 响应中的 node 字段标明数据来自哪个节点（需要全局去重时应在同一节点上查询或汇总各节点的结果）
+DICOM_INDEX_DB = os.environ.get('DICOM_INDEX_DB', './dicom_index.db')
+dicom_index = DicomIndex(DICOM_INDEX_DB)
+
+# 推理引擎：加载 YOLO 模型（可通过 MODEL_CONFIG 指定多模型 JSON 配置，否则加载默认的 ./model.pt）
+engine = create_engine()
+registry = engine.registry
+MODELS_DIR = os.environ.get('MODELS_DIR', './models')  # /models/load 可加载的权重文件目录
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')  # 管理接口（/admin/*、模型加载与切换、检查 / 序列查询）的访问令牌（X-Admin-Token 请求头），为空时不开放
+
+# 内存统计与 RSS 看门狗：超过 MEMORY_SOFT_LIMIT_MB 时按顺序清理缓存（模型只统计不清理）
+memory_monitor = MemoryMonitor([
+    ('encoded_cache', encoded_cache),
+    ('decoded_dicom', pixel_decoder),
+    ('result_store', result_store),
+    ('models', registry),
+])
+
+
+def require_admin(view):
+    '''管理接口：请求头 X-Admin-Token 必须与 ADMIN_TOKEN 一致，未配置 ADMIN_TOKEN 时不开放'''
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Not found'}), 404
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+            return jsonify({'error': 'Invalid admin token'}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def cache_entry(data, model_entry, **extra):
+    '''缓存条目，记录生成该结果的模型版本，避免不同版本的结果混用'''
+    entry = {'data': data, 'model': model_entry.name, 'model_version': model_entry.version}
+    entry.update(extra)
+    return entry
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    start_time = time.time()
+    file = request.files['file']
+    filename = file.filename
+    try:
+        img, file_ext, dicom_metadata = load_image(file.stream, filename)
+    except UnsupportedFormatError:
+        return jsonify({'error': 'Unsupported file format'}), 400
+
+    # 标注图默认沿用上传图像的格式
+    labeled_codec = IMAGE_CODEC if IMAGE_CODEC != 'auto' else ('jpeg' if img.format == 'JPEG' else 'png')
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # 原始图像在编码线程池中编码，与推理并行
+    # 编码线程与推理共享同一图像，load_image 必须已完整解码（Pillow 的延迟 load() 不是线程安全的）
+    image_codec = IMAGE_CODEC if IMAGE_CODEC != 'auto' else ('jpeg' if file_ext == '.jpg' else 'png')
+    img_future = encode_pool.submit(encode_image, img, image_codec)
+
+    # 得到阈值
+    conf_threshold = float(request.form.get('conf_threshold', 0.5))
+    iou_threshold = float(request.form.get('iou_threshold', 0.7))
+    
+    
+    # 推理模式：full（默认，全分辨率分割）或 triage（快速筛查，有可疑目标时再全分辨率复查）
+    mode = request.form.get('mode', 'full')
+    model_spec = request.form.get('model')  # 形如 "name" 或 "name:version"
+    try:
+        analysis = engine.analyze(img, conf_threshold, iou_threshold, mode, model_spec,
+                                  pixel_spacing=(dicom_metadata or {}).get('image_pixel_spacing'))
+    except KeyError as e:
+        return jsonify({'error': f"Unknown model: {e}"}), 400
+
+    if analysis is None:
+        return jsonify({'error': 'No detection results'}), 400
+
+    result = analysis['result']
+    model_entry = analysis['model_entry']
+    triage_path = analysis['triage_path']
+    predictions = analysis['predictions']
+    diagnosis_summary = analysis['diagnosis_summary']
+    total_detections = len(predictions)
+
+    # 处理掩码数据
+    if analysis['masks_data'] is not None:
+        masks_data = analysis['masks_data']
+        orig_h, orig_w = analysis['orig_shape']
+        # 全部 mask 在编码线程池中一次缩放并按位压缩
+        mask_futures = split_future(encode_pool.submit(resize_and_pack_masks, masks_data, orig_w, orig_h),
+                                    len(masks_data))
+        for mask_future, mask_data, pred in zip(mask_futures, masks_data, predictions):
+            mask_id = new_id()
+            result_store.put('mask', mask_id, cache_entry(mask_future, model_entry), held_bytes=mask_data.nbytes)
+            pred['mask_id'] = mask_id
+
+    # 计算推理时间
+    inference_time = round(time.time() - start_time, 2)
+
+    # 缓存原始图像
+    image_id = new_id()
+    result_store.put('image', image_id, cache_entry(img_future, model_entry, codec=image_codec),  # 原始图像 (bytes, mimetype)
+                     held_bytes=img.width * img.height * len(img.getbands()))
+
+    # 带检测框和标签的图像在编码线程池中绘制并编码，不阻塞本次请求
+    labeled_image_id = new_id()
+    result_store.put('labeled_image', labeled_image_id,
+                     cache_entry(encode_pool.submit(render_labeled_image, result, labeled_codec),
+                                 model_entry, codec=labeled_codec),
+                     held_bytes=result_nbytes(result))  # 绘制完成前持有推理结果的张量
+
+    result_data = {
+        'image_id': image_id, # 返回原始图像的 ID
+        'labeled_image_id': labeled_image_id, # 返回标注图像的 ID
+        'format': file_ext, # 返回原始图像的格式
+        'predictions': predictions, # 返回预测结果
+        'total_detections': total_detections, # 返回检测到的目标数量
+        'inference_time': inference_time, # 返回推理时间
+        'diagnosis_summary': diagnosis_summary, # 返回诊断总结
+        'model': model_entry.name, # 返回使用的模型名称
+        'model_version': model_entry.version, # 返回使用的模型版本
+        'mode': mode, # 返回推理模式
+        'triage_path': triage_path, # 快速筛查路径：fast_negative / escalated
+        'dicom': dicom_metadata # 返回 DICOM 元数据（非 DICOM 文件为 None）
+    }
+
+    result_store.put('prediction', image_id, {'data': result_data})  # 用于 /labeled_image 接口获取预测信息
+    if dicom_metadata:
+        dicom_index.add(dicom_metadata, result_data)
+    return jsonify(result_data)
+
+def resize_and_pack_masks(masks_data, orig_w, orig_h):
+    '''将模型分辨率的全部 mask 缩放到原图尺寸并按位压缩'''
+    return [pack_mask(mask) for mask in resize_masks(masks_data, orig_w, orig_h)]
+
+def render_labeled_image(result, codec):
+    '''生成带检测框和标签的图像并编码'''
+    return encode_image(render_labeled(result), codec)
+
+
+
+def send_image_entry(resource_id, entry):
+    '''按请求的编码返回原图 / 标注图，例如 ?codec=webp&lossless=1 或 ?codec=jpeg&quality=80'''
+    codec, options = image_options(request.args, request.headers.get('Accept', ''))
+    data, mimetype = resolve(entry['data'])
+    if codec and (codec != entry['codec'] or options):
+        key = (resource_id, codec, tuple(sorted(options.items())))
+        encoded = encoded_cache.get(key)
+        if encoded is None:
+            encoded = encode_pool.submit(reencode_image, data, codec, **options).result()
+            encoded_cache.put(key, encoded)
+        data, mimetype = encoded
+    response = make_response(send_file(io.BytesIO(data), mimetype=mimetype))
+    response.vary.add('Accept')  # 未指定 codec 时按 Accept 选择 webp，共享缓存需要区分
+    return response
+
+def send_mask_entry(resource_id, entry):
+    '''按请求的编码返回 mask：?codec=png（默认）/ png1（1 位 PNG）/ packbits（按位原始数据）'''
+    codec = request.args.get('codec', MASK_CODEC)
+    packed = resolve(entry['data'])
+    key = (resource_id, codec)
+    encoded = encoded_cache.get(key)
+    if encoded is None:
+        encoded = encode_pool.submit(encode_mask, packed, codec).result()
+        encoded_cache.put(key, encoded)
+    data, mimetype = encoded
+    response = make_response(send_file(io.BytesIO(data), mimetype=mimetype))
+    response.headers['X-Mask-Shape'] = f"{packed['shape'][0]},{packed['shape'][1]}"
+    return response
+
+def not_found(resource_id, message):
+    '''
+    本节点找不到结果时，若 ID 属于其他已知节点（结果可能仍在该节点编码或只存在于该节点），
+    重定向到所属节点；否则返回 404
+    '''
+    owner = node_of(resource_id)
+    if owner and owner != NODE_ID and owner in NODE_ADDRESSES:
+        return redirect(NODE_ADDRESSES[owner].rstrip('/') + request.full_path.rstrip('?'), code=307)
+    return jsonify({'error': message, 'node': owner}), 404
+
+@app.route('/image/<image_id>', methods=['POST', 'GET'])
+def get_image(image_id):
+    try:
+        entry = result_store.get('image', image_id)
+        if entry:
+            return send_image_entry(image_id, entry)
+
+        entry = result_store.get('mask', image_id)
+        if entry:
+            return send_mask_entry(image_id, entry)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return not_found(image_id, 'Image or Mask not found')
+
+@app.route('/labeled_image/<image_id>', methods=['POST', 'GET'])
+def get_labeled_image(image_id):
+    entry = result_store.get('labeled_image', image_id)
+    if not entry:
+        return not_found(image_id, 'Labeled image not found')
+    try:
+        return send_image_entry(image_id, entry)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.after_request
+def compress_json_response(response):
+    '''按 Accept-Encoding 对 JSON 响应进行 zstd / gzip 压缩'''
+    if response.mimetype != 'application/json' or response.direct_passthrough \
+            or 'Content-Encoding' in response.headers:
+        return response
+    body, encoding = compress_json(response.get_data(), request.headers.get('Accept-Encoding', ''))
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+# 检查 / 序列 / 实例查询的结果包含患者信息，与管理接口一样需要 ADMIN_TOKEN
+@app.route('/studies/<study_uid>/results', methods=['GET'])
+@require_admin
+def get_study_results(study_uid):
+    '''某个检查的所有结果'''
+    try:
+        limit = int(request.args.get('limit', 1000))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    return jsonify({'study_uid': study_uid, 'node': NODE_ID, 'results': dicom_index.study_results(study_uid, limit)})
+
+@app.route('/series/<series_uid>/latest', methods=['GET'])
+@require_admin
+def get_series_latest(series_uid):
+    '''某个序列的最新结果'''
+    result = dicom_index.latest_series_result(series_uid)
+    if result is None:
+        return jsonify({'error': 'Series not found', 'node': NODE_ID}), 404
+    result['node'] = NODE_ID
+    return jsonify(result)
+
+@app.route('/instances/<sop_uid>/processed', methods=['GET'])
+@require_admin
+def get_instance_processed(sop_uid):
+    '''某个 SOPInstanceUID 是否已处理'''
+    record = dicom_index.instance_processed(sop_uid)
+    return jsonify({'sop_uid': sop_uid, 'node': NODE_ID, 'processed': record is not None, 'latest': record})
+
+@app.route('/metrics/triage', methods=['GET'])
+def get_triage_metrics():
+    '''本节点的快速筛查统计（进程内存）'''
+    return jsonify(dict(engine.triage_metrics(), node=NODE_ID))
+
+@app.route('/metrics/decode', methods=['GET'])
+def get_decode_metrics():
+    '''各传输语法的 DICOM 解码耗时与解码缓存占用'''
+    return jsonify(pixel_decoder.stats())
+
+@app.route('/admin/memory', methods=['GET'])
+@require_admin
+def get_memory_report():
+    '''各缓存的字节数、最大条目、分配器与 tracemalloc 统计、RSS 历史'''
+    try:
+        top = int(request.args.get('top', 10))
+    except ValueError:
+        return jsonify({'error': 'top must be an integer'}), 400
+    return jsonify(memory_monitor.report(top))
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    return jsonify(registry.list_models())
+
+@app.route('/models/load', methods=['POST'])
+@require_admin
+def load_model():
+    '''后台加载新模型并预热，完成后原子切换为默认版本'''
+    name = request.form.get('name')
+    path = request.form.get('path')
+    if not name or not path:
+        return jsonify({'error': 'name and path are required'}), 400
+    # 只允许加载模型目录内的权重文件（加载权重会反序列化文件内容）
+    models_dir = os.path.realpath(MODELS_DIR)
+    path = os.path.realpath(os.path.join(models_dir, path))
+    if os.path.commonpath([models_dir, path]) != models_dir:
+        return jsonify({'error': 'Model path must be inside the models directory'}), 403
+    if not os.path.isfile(path):
+        return jsonify({'error': f'Model file not found: {request.form.get("path")}'}), 404
+    make_default = request.form.get('make_default', 'true').lower() == 'true'
+    key = registry.load_async(name, path, request.form.get('version'), make_default)
+    return jsonify({'status': 'loading', 'model': key}), 202
+
+@app.route('/models/default', methods=['POST'])
+@require_admin
+def set_default_model():
+    name = request.form.get('name')
+    try:
+        registry.set_default_name(name)
+    except KeyError:
+        return jsonify({'error': f'Unknown model: {name}'}), 404
+    return jsonify(registry.list_models())
+
+@app.route('/models/<key>', methods=['DELETE'])
+@require_admin
+def unload_model(key):
+    try:
+        registry.unload(key)
+    except KeyError:
+        return jsonify({'error': f'Unknown model: {key}'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify(registry.list_models())
+
+def clear_cache():
+    while True:
+        time.sleep(60*60)  # 每小时清理一次
+        result_store.expire()
+        encoded_cache.clear()
+        print("所有缓存已清理")
+
+# 启动后台线程
+threading.Thread(target=clear_cache, daemon=True).start()
+memory_monitor.start()
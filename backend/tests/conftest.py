@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试直接导入 backend 目录下的模块（与 App.py 的导入方式一致）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
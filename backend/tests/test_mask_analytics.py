@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from mask_analytics import letterbox_region, mask_statistics, resize_masks
+
+
+def rect_masks(shape, rects):
+    '''每个矩形 (x1, y1, x2, y2) 生成一个 0/1 mask'''
+    masks = np.zeros((len(rects),) + shape, dtype=np.float32)
+    for mask, (x1, y1, x2, y2) in zip(masks, rects):
+        mask[y1:y2, x1:x2] = 1
+    return masks
+
+
+def test_square_mask_statistics():
+    stats = mask_statistics(rect_masks((100, 100), [(10, 20, 30, 60)]), (100, 100))
+    assert len(stats) == 1
+    s = stats[0]
+    assert s['area'] == 20 * 40
+    assert s['centroid'] == pytest.approx([20.0, 40.0])
+    assert s['extent'] == pytest.approx([10.0, 20.0, 30.0, 60.0])
+    assert s['perimeter'] == pytest.approx(2 * (20 + 40))
+    assert s['physical_area'] is None and s['physical_perimeter'] is None
+    assert s['overlaps'] == []
+
+
+def test_scaled_to_original_resolution():
+    # 模型分辨率 100x100，原图 300x300：无填充，统一放大 3 倍
+    s = mask_statistics(rect_masks((100, 100), [(10, 20, 30, 60)]), (300, 300))[0]
+    assert s['area'] == pytest.approx(20 * 40 * 9)
+    assert s['centroid'] == pytest.approx([60.0, 120.0])
+    assert s['extent'] == pytest.approx([30.0, 60.0, 90.0, 180.0])
+    assert s['perimeter'] == pytest.approx(2 * (20 + 40) * 3)
+
+
+def test_letterbox_padding_is_removed():
+    # 原图 300x640 按比例 1 放入 320x640 的网络输入，上下各填充 10 行
+    assert letterbox_region((320, 640), (300, 640)) == (10, 310, 0, 640)
+    masks = rect_masks((320, 640), [(200, 110, 300, 160)])
+    s = mask_statistics(masks, (300, 640))[0]
+    assert s['area'] == 100 * 50
+    assert s['centroid'] == pytest.approx([250.0, 125.0])
+    assert s['extent'] == pytest.approx([200.0, 100.0, 300.0, 150.0])
+
+    resized = resize_masks(masks, 640, 300)
+    assert resized.shape == (1, 300, 640)
+    assert resized.dtype == np.uint8
+    ys, xs = np.nonzero(resized[0])
+    assert (ys.min(), ys.max() + 1, xs.min(), xs.max() + 1) == (100, 150, 200, 300)
+
+
+def test_physical_area_and_perimeter():
+    s = mask_statistics(rect_masks((100, 100), [(0, 0, 10, 20)]), (100, 100), pixel_spacing=[0.5, 0.25])[0]
+    assert s['physical_area'] == pytest.approx(10 * 20 * 0.5 * 0.25)
+    # 水平边按列间距、竖直边按行间距换算
+    assert s['physical_perimeter'] == pytest.approx(2 * 10 * 0.25 + 2 * 20 * 0.5)
+
+
+def test_overlap_and_iou():
+    stats = mask_statistics(rect_masks((50, 50), [(0, 0, 20, 20), (10, 10, 30, 30), (40, 40, 50, 50)]), (50, 50))
+    first, second, third = stats
+    assert first['overlaps'] == [{'id': 2, 'area': 100.0, 'iou': pytest.approx(100 / 700)}]
+    assert second['overlaps'] == [{'id': 1, 'area': 100.0, 'iou': pytest.approx(100 / 700)}]
+    assert third['overlaps'] == []
+
+
+def test_empty_masks():
+    assert mask_statistics(np.zeros((0, 32, 32)), (64, 64)) == []
+    assert resize_masks(np.zeros((0, 32, 32)), 64, 64).shape == (0, 64, 64)
+    s = mask_statistics(np.zeros((1, 32, 32)), (32, 32))[0]
+    assert s['area'] == 0 and s['extent'] is None
@@ -0,0 +1,54 @@
+from concurrent.futures import Future
+
+import pytest
+
+from result_store import DiskStore, MemoryStore, dump_entry, entry_nbytes, load_entry, new_id, node_of
+
+
+@pytest.mark.parametrize('entry', [
+    {'data': (b'\x89PNG\r\n\x1a\n...', 'image/png'), 'model': 'default', 'model_version': 'abc123', 'codec': 'png'},
+    {'data': {'bits': bytes(range(256)), 'shape': (40, 51)}, 'model': 'default', 'model_version': None},
+    {'data': {'predictions': [{'id': 1, 'label': '胶质瘤', 'bbox': [1.5, 2, 3, 4]}], 'total_detections': 1}},
+])
+def test_dump_load_round_trip(entry):
+    assert load_entry(dump_entry(entry)) == entry
+
+
+def test_entry_nbytes():
+    assert entry_nbytes({'data': (b'12345', 'image/png')}) == 5
+    assert entry_nbytes({'data': {'bits': b'123', 'shape': (4, 6)}}) == 3
+    assert entry_nbytes({'data': Future()}) == 0
+    assert entry_nbytes({'data': {'a': '胶'}}) == len('{"a": "胶"}'.encode('utf-8'))
+
+
+def test_resource_ids_carry_the_node():
+    resource_id = new_id()
+    assert node_of(resource_id) is not None
+    assert resource_id.startswith(node_of(resource_id) + '.')
+    assert node_of('not-a-node-id') is None
+
+
+def test_pending_entry_is_written_when_the_future_completes(tmp_path):
+    store = DiskStore(root=str(tmp_path))
+    future = Future()
+    store.put('image', 'node.x', {'data': future, 'codec': 'png'}, held_bytes=100)
+    assert store.get('image', 'node.x')['data'] is future
+    assert store.memory_items() == [('node.x', 'image (encoding)', 100)]
+
+    future.set_result((b'png-bytes', 'image/png'))
+    assert store.get('image', 'node.x') == {'data': (b'png-bytes', 'image/png'), 'codec': 'png'}
+    assert store.memory_items() == []
+
+
+def test_disk_store_rejects_path_traversal(tmp_path):
+    store = DiskStore(root=str(tmp_path))
+    assert store.get('image', '../../etc/passwd') is None
+
+
+def test_memory_store_sheds_at_least_one_entry():
+    store = MemoryStore()
+    store.put('prediction', 'a', {'data': {'x': 1}})
+    store.put('prediction', 'b', {'data': {'x': 2}})
+    assert store.shed(0.1) > 0
+    assert store.get('prediction', 'a') is None
+    assert store.get('prediction', 'b') is not None
@@ -8,10 +8,24 @@ from PyQt5.QtGui import QPixmap, QImage, QPainter, QIcon
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 import requests
 import warnings
+from collections import OrderedDict
+
+from batch import BatchWindow
+from export import ExportThread
+from local_engine import LocalPredictionThread, LocalStore
+from mask_compositor import MaskCompositor
+from render_state import RenderState, RENDER_RESULT, RENDER_TARGET, RENDER_IMAGES
+from resource_cache import ImageCache
+from resource_loader import ResourceLoader
 
 
 # 这里可以根据需要修改为实际的后端服务地址
 Server_URL = "http://localhost:5000"  # 后端服务地址
+IMAGE_CACHE_MB = 256  # 本地图像缓存上限（MB）
+LOADER_WORKERS = 6  # 并发下载图像的线程数
+RENDER_TRACE = bool(os.environ.get('RENDER_TRACE'))  # 打印每次渲染由哪些操作触发
+# 推理模式：server（默认，调用后端服务）或 local（单机部署时在进程内直接调用推理引擎）
+INFERENCE_MODE = os.environ.get('INFERENCE_MODE', 'server')
 
 
 #  创建 image_label——带阴影
@@ -75,8 +89,26 @@ class MainWindow(QWidget):
         super().__init__()
         self.setWindowTitle("脑肿瘤智能检测与诊断系统")
         self.resize(1000, 850)
+        self.image_cache = ImageCache(IMAGE_CACHE_MB * 1024 * 1024)  # 解码后的图像与缩放结果缓存
+        # 异步加载器：所有图像下载都在线程池中完成，不阻塞界面
+        # 本地模式的结果图像保存在内存中，由加载器直接读取
+        self.local_store = LocalStore() if INFERENCE_MODE == 'local' else None
+        self.loader = ResourceLoader(Server_URL, self.image_cache, max_workers=LOADER_WORKERS,
+                                     local_store=self.local_store, parent=self)
+        self.loader.loaded.connect(lambda key: self.state.update('loaded', {RENDER_IMAGES}))
+        self.loader.failed.connect(lambda key, message: self.state.update('load_failed', {RENDER_IMAGES}))
+        # 渲染状态：控件只修改状态，同一事件循环内合并为一次渲染
+        self.state = RenderState(self.render, trace=RENDER_TRACE)
+        self.compositor = MaskCompositor()  # 多目标 mask 合成
+        self._compositor_key = None  # (image_id, 宽, 高)，变化时重置合成器
+        self.result = None
+        self.image_id = None
+        self.session_results = OrderedDict()  # 本次会话处理过的结果：image_id -> (文件路径, 结果)
         self.init_ui()
         self.setup_ui()
+        # 显示选项以控件的初始状态为准（如分割结果默认不勾选）
+        for name, value in self.view_options().items():
+            setattr(self.state, name, value)
         self.conf_threshold=0.3 # 置信度阈值
         self.iou_threshold=0.7# IoU阈值
         
@@ -164,6 +196,7 @@ class MainWindow(QWidget):
         self.window1_label = QLabel("窗口1:")
         self.segmentation_result_checkbox = QtWidgets.QCheckBox("显示分割结果")
         self.detection_box_checkbox = QtWidgets.QCheckBox("显示检测框与标签")
+        self.all_masks_checkbox = QtWidgets.QCheckBox("显示全部目标")
         self.window2_label = QLabel("窗口2:")
         self.mask_radio = QRadioButton("显示Mask")
         self.mask_radio.setChecked(True)  # 默认显示 mask
@@ -208,9 +241,16 @@ class MainWindow(QWidget):
         self.table.setColumnCount(5)
         self.table.setHorizontalHeaderLabels(["序号", "中文类别","英文类别", "置信度", "坐标位置"])
         self.table.verticalHeader().setVisible(False) # 隐藏行号
+        # 表格设置交替行颜色
+        self.table.setAlternatingRowColors(True)
+        self.table.setStyleSheet("""
+            alternate-background-color: #f2f2f2;
+            selection-background-color: #cce5ff;
+        """)
 
         # 按钮区域
         self.open_image_button = QPushButton("打开图片/.dcm影像")
+        self.batch_button = QPushButton("批量处理")
         self.save_result_button = QPushButton("保存结果")
         self.exit_button = QPushButton("退出系统")
 
@@ -246,6 +286,7 @@ class MainWindow(QWidget):
         window_layout.addWidget(self.window1_label)
         window_layout.addWidget(self.segmentation_result_checkbox)
         window_layout.addWidget(self.detection_box_checkbox)
+        window_layout.addWidget(self.all_masks_checkbox)
         window_layout.addWidget(self.window2_label)
         window_layout.addWidget(self.mask_radio)
         window_layout.addWidget(self.original_image_radio)
@@ -308,6 +349,7 @@ class MainWindow(QWidget):
         # 按钮布局
         button_layout = QHBoxLayout()
         button_layout.addWidget(self.open_image_button)
+        button_layout.addWidget(self.batch_button)
         button_layout.addWidget(self.save_result_button)
         button_layout.addWidget(self.exit_button)
         main_layout.addLayout(button_layout)
@@ -317,61 +359,124 @@ class MainWindow(QWidget):
 
         # 在这里绑定按钮点击事件
         self.open_image_button.clicked.connect(self.select_file)
+        self.batch_button.clicked.connect(self.open_batch_window)
         self.save_result_button.clicked.connect(self.save_result)
         self.exit_button.clicked.connect(self.exit_app)
-        self.mask_radio.toggled.connect(self.display_results)
-        self.original_image_radio.toggled.connect(self.display_results)
-        self.target_selection_combo.currentIndexChanged.connect(self.display_results)
-        self.segmentation_result_checkbox.toggled.connect(self.display_results)
-        self.detection_box_checkbox.toggled.connect(self.display_results)
+        # 显示选项与目标选择只连接一次，事件处理只修改渲染状态
+        self.mask_radio.toggled.connect(lambda: self.on_view_option_changed('mask_radio'))
+        self.original_image_radio.toggled.connect(lambda: self.on_view_option_changed('original_image_radio'))
+        self.segmentation_result_checkbox.toggled.connect(lambda: self.on_view_option_changed('segmentation'))
+        self.detection_box_checkbox.toggled.connect(lambda: self.on_view_option_changed('detection'))
+        self.all_masks_checkbox.toggled.connect(lambda: self.on_view_option_changed('all_masks'))
+        self.target_selection_combo.currentIndexChanged.connect(self.on_target_changed)
         self.refresh_window1_button.clicked.connect(lambda: self.refresh_window())
 
     def refresh_window(self):
         '''刷新窗口内容'''
-        if not hasattr(self, 'result') or not self.image_id:
+        if not self.result or not self.image_id:
             return
-        self.load_and_display_image()
-        self.display_results(self.result)
-
-    def load_and_display_image(self):
-        '''加载并显示图像'''
-        if not self.image_id:
-            self.image_label1.setText("无图像数据")
+        self.loader.retry_failed()  # 刷新时重新下载之前失败的图像
+        self.state.update('refresh', {RENDER_IMAGES})
+
+    def view_options(self):
+        '''显示选项控件的当前值，对应 RenderState 的同名字段'''
+        return {
+            'show_segmentation': self.segmentation_result_checkbox.isChecked(),
+            'show_detection': self.detection_box_checkbox.isChecked(),
+            'show_all_masks': self.all_masks_checkbox.isChecked(),
+            'show_mask': self.mask_radio.isChecked(),
+        }
+
+    def on_view_option_changed(self, action):
+        '''显示选项变化：只更新渲染状态'''
+        self.state.update(action, {RENDER_IMAGES}, **self.view_options())
+
+    def fetch_image(self, endpoint, resource_id, fmt=None, priority=10):
+        """
+        从缓存获取图像；未缓存时交给异步加载器下载，下载完成后自动重绘
+        :param endpoint: 'image'（原图/mask）或 'labeled_image'
+        :return: QImage 对象或 None（尚未加载）
+        """
+        if not resource_id:
+            return None
+        qimg = self.image_cache.get((endpoint, resource_id))
+        if qimg is None:
+            self.loader.request(endpoint, resource_id, fmt, priority)
+        return qimg
+
+    def loading_text(self, endpoint, resource_id, failed_text):
+        '''图像尚未就绪时的提示文字'''
+        if self.loader.is_pending((endpoint, resource_id)):
+            return "加载中..."
+        return failed_text
+
+    def prefetch_resources(self, selected_index=0):
+        '''并发预取当前结果的原图、标注图与所有 mask，当前目标和下一个目标优先'''
+        if not self.result:
             return
-
-        image_url = f"{Server_URL}/image/{self.image_id}"
-        try:
-            response = requests.post(image_url)
-            if response.status_code == 200:
-                image_data = response.content
-                q_image = QImage()
-                q_image.loadFromData(image_data)
-
-                pixmap = QPixmap.fromImage(q_image).scaled(
-                    self.image_label1.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                self.image_label1.setPixmap(pixmap)
+        self.loader.request('image', self.image_id, priority=10)
+        self.loader.request('labeled_image', self.result.get('labeled_image_id'), priority=9)
+        predictions = self.result.get('predictions', [])
+        for index, pred in enumerate(predictions):
+            if index == selected_index:
+                priority = 8
+            elif index == selected_index + 1:
+                priority = 5
             else:
-                self.image_label1.setText("图像加载失败")
-        except Exception as e:
-            self.image_label1.setText(f"加载错误: {str(e)}")
+                priority = 1
+            self.loader.request('image', pred.get('mask_id'), "PNG", priority)
 
-    def display_results(self, response_json=None):
-        '''显示识别结果'''
-        print("Received response type:", type(response_json))
-        print("Response content:", response_json)
+    def get_scaled_pixmap(self, endpoint, resource_id, size, transform=Qt.FastTransformation, fmt=None):
+        """
+        获取按控件大小缩放后的 QPixmap（同样缓存），切换显示时无需重新下载或缩放
+        :return: QPixmap 对象或 None
+        """
+        if not resource_id:
+            return None
+        key = ('scaled', endpoint, resource_id, size.width(), size.height(), int(transform))
+        pixmap = self.image_cache.get(key)
+        if pixmap is not None:
+            return pixmap
 
+        qimg = self.fetch_image(endpoint, resource_id, fmt)
+        if qimg is None:
+            return None
+        pixmap = QPixmap.fromImage(qimg).scaled(size, Qt.KeepAspectRatio, transform)
+        self.image_cache.put(key, pixmap)
+        return pixmap
+
+    def display_results(self, response_json=None):
+        '''显示识别结果：保存结果并请求一次完整渲染'''
         if not isinstance(response_json, dict):
             return
-        
-        
-        if response_json is not None:
-            # 保存响应数据和图像 ID
-            self.result = response_json
-            self.image_id = self.result.get('image_id')
-            self.img_format = self.result.get('format', '.jpg')
+
+        # 保存响应数据和图像 ID
+        self.result = response_json
+        self.image_id = self.result.get('image_id')
+        self.img_format = self.result.get('format', '.jpg')
+
+        # 异步加载原图、标注图与所有 mask
+        self.prefetch_resources()
+        self.state.update('result', {RENDER_RESULT, RENDER_TARGET, RENDER_IMAGES},
+                          result=response_json, selected_index=0)
+
+    def render(self, parts):
+        '''一次渲染：只更新被标记的部分'''
+        if RENDER_RESULT in parts:
+            self.render_result()
+        if RENDER_TARGET in parts:
+            self.render_target()
+        if RENDER_IMAGES in parts:
+            self.redraw_images()
+
+    def render_result(self):
+        '''诊断总结、目标下拉框、表格与顶部信息'''
+        result = self.state.result
+        if not result:
+            return
 
         # 获取诊断总结
-        diagnosis_summary = self.result.get('diagnosis_summary', [])
+        diagnosis_summary = result.get('diagnosis_summary', [])
         if diagnosis_summary:
             html_content = ""
             for line in diagnosis_summary:
@@ -387,96 +492,24 @@ class MainWindow(QWidget):
                     html_content += f"{line}<br>"
             self.recognition_result_text.setText(html_content)
 
+        predictions = result.get('predictions', [])
 
-        # 异步加载主图
-        self.load_and_display_image()
-
-        predictions = self.result.get('predictions', [])
-
-        # 当新图像没有检测结果时，直接将窗口2设置为默认提示信息
+        # 当新图像没有检测结果时，重置相关控件
         if not predictions:
-            self.image_label2.setText("未检测到目标")
             self.reset_ui_elements()
             return
-    
-        # 下拉框绑定目标列表
+
+        # 下拉框绑定目标列表（屏蔽信号，避免重新填充时触发额外的渲染）
+        self.target_selection_combo.blockSignals(True)
         self.target_selection_combo.clear()
         for pred in predictions:
             self.target_selection_combo.addItem(f"目标 {pred['id']} ({pred['label']})", userData=pred)
-
-        # 默认选择第一个目标
-        selected_pred = self.target_selection_combo.currentData() if predictions else None
-
-        # 获取窗口状态
-        show_segmentation = self.segmentation_result_checkbox.isChecked()
-        show_detection = self.detection_box_checkbox.isChecked()
-        show_mask = self.mask_radio.isChecked()
-
-        # 先判断是否显示检测框图像
-        if show_detection:
-            qimg = self.get_label_image()
-            if qimg is not None:
-                pixmap = QPixmap.fromImage(qimg).scaled(
-                    self.image_label1.size(), Qt.KeepAspectRatio
-                )
-
-                # 如果叠加 mask
-                if show_segmentation and selected_pred:
-                    pixmap = self.draw_image_with_mask(pixmap, selected_pred, True)
-
-                self.image_label1.setPixmap(pixmap)
-                return
-
-        # 否则才进入常规绘制流程（原始图像 + 可选 mask）
-        qimg = self.get_original_image()
-        if qimg is None:
-            self.image_label1.setText("无图像数据")
-            return
-
-        pixmap = QPixmap.fromImage(qimg).scaled(self.image_label1.size(), Qt.KeepAspectRatio)
-
-        # 绘制 mask
-        if show_segmentation and selected_pred:
-            pixmap = self.draw_image_with_mask(pixmap, selected_pred, True)
-
-        self.image_label1.setPixmap(pixmap)
-
-        # 更新目标信息
-        if selected_pred:
-            bbox = selected_pred.get('bbox')
-            confidence = selected_pred.get('confidence', 0)
-            label = selected_pred.get('label', '未知')
-
-            # 更新目标位置标签
-            if bbox and len(bbox) == 4:
-                x1, y1, x2, y2 = map(int, bbox)
-                self.xmin_label.setText(f"xmin: {x1}")
-                self.ymin_label.setText(f"ymin: {y1}")
-                self.xmax_label.setText(f"xmax: {x2}")
-                self.ymax_label.setText(f"ymax: {y2}")
-            else:
-                self.xmin_label.setText("xmin: N/A")
-                self.ymin_label.setText("ymin: N/A")
-                self.xmax_label.setText("xmax: N/A")
-                self.ymax_label.setText("ymax: N/A")
-
-            # 更新识别结果
-            self.result_text.setText(f"{label} (置信度: {confidence:.2f})")
-
-            # 切换 window2 内容
-            self.update_window2_display(selected_pred, show_mask)
-
-        else:
-            self.xmin_label.setText("xmin: N/A")
-            self.ymin_label.setText("ymin: N/A")
-            self.xmax_label.setText("xmax: N/A")
-            self.ymax_label.setText("ymax: N/A")
-            self.result_text.setText("暂无目标")
-            self.image_label2.setText("未检测到目标")
+        self.target_selection_combo.setCurrentIndex(self.state.selected_index)
+        self.target_selection_combo.blockSignals(False)
 
         # 更新顶部信息
         self.total_targets_label.setText(f"总目标数: {len(predictions)}")
-        self.time_label.setText(f"用时: {self.result.get('inference_time', 0):.2f}s")
+        self.time_label.setText(f"用时: {result.get('inference_time', 0):.2f}s")
 
         # 表格填充
         self.table.setRowCount(len(predictions))
@@ -488,25 +521,22 @@ class MainWindow(QWidget):
             bbox = pred['bbox']
             self.table.setItem(row, 4, QTableWidgetItem(f"[{int(bbox[0])},{int(bbox[1])},{int(bbox[2])},{int(bbox[3])}]"))
 
-        # 表格设置交替行颜色
-        self.table.setAlternatingRowColors(True)
-        self.table.setStyleSheet("""
-            alternate-background-color: #f2f2f2;
-            selection-background-color: #cce5ff;
-        """)
-
-        # 绑定下拉框事件（防止重复绑定）
-        self.target_selection_combo.currentIndexChanged.connect(self.on_target_changed)
-
-
-    def on_target_changed(self):
-        """ 下拉框切换目标时刷新显示 """
-        selected_pred = self.target_selection_combo.currentData()
+    def render_target(self):
+        '''当前目标的位置与置信度'''
+        selected_pred = self.state.selected_prediction()
         if not selected_pred:
+            self.xmin_label.setText("xmin: N/A")
+            self.ymin_label.setText("ymin: N/A")
+            self.xmax_label.setText("xmax: N/A")
+            self.ymax_label.setText("ymax: N/A")
+            self.result_text.setText("暂无目标")
             return
 
-        # 更新目标位置
         bbox = selected_pred.get('bbox')
+        confidence = selected_pred.get('confidence', 0)
+        label = selected_pred.get('label', '未知')
+
+        # 更新目标位置标签
         if bbox and len(bbox) == 4:
             x1, y1, x2, y2 = map(int, bbox)
             self.xmin_label.setText(f"xmin: {x1}")
@@ -519,10 +549,47 @@ class MainWindow(QWidget):
             self.xmax_label.setText("xmax: N/A")
             self.ymax_label.setText("ymax: N/A")
 
-        # 切换 mask / 原图
-        show_mask = self.mask_radio.isChecked()
-        self.update_window2_display(selected_pred, show_mask)
-        
+        # 更新识别结果
+        self.result_text.setText(f"{label} (置信度: {confidence:.2f})")
+
+    def redraw_images(self):
+        '''根据渲染状态，从缓存重绘窗口1和窗口2'''
+        state = self.state
+        if not state.result:
+            return
+
+        selected_pred = state.selected_prediction()
+
+        # 先判断是否显示检测框图像，否则使用原始图像
+        pixmap = None
+        if state.show_detection:
+            pixmap = self.get_scaled_pixmap('labeled_image', state.result.get('labeled_image_id'),
+                                            self.image_label1.size())
+        if pixmap is None:
+            pixmap = self.get_scaled_pixmap('image', self.image_id, self.image_label1.size())
+
+        if pixmap is None:
+            self.image_label1.setText(self.loading_text('image', self.image_id, "无图像数据"))
+        else:
+            # 绘制 mask
+            if state.show_segmentation and selected_pred:
+                pixmap = self.draw_image_with_mask(pixmap, selected_pred, True)
+            self.image_label1.setPixmap(pixmap)
+
+        # 切换 window2 内容
+        self.update_window2_display(selected_pred, state.show_mask)
+
+    def on_target_changed(self, index):
+        """ 下拉框切换目标：只更新渲染状态 """
+        if index < 0:
+            return
+
+        # 预取下一个目标的 mask
+        if index + 1 < self.target_selection_combo.count():
+            next_pred = self.target_selection_combo.itemData(index + 1)
+            self.loader.request('image', next_pred.get('mask_id'), "PNG", priority=5)
+
+        self.state.update('target', {RENDER_TARGET, RENDER_IMAGES}, selected_index=index)
 
     def update_window2_display(self, selected_pred, show_mask):
         if not selected_pred:
@@ -532,72 +599,19 @@ class MainWindow(QWidget):
         if show_mask:
             mask_id = selected_pred.get('mask_id')
             if mask_id:
-                mask_url = f"{Server_URL}/image/{mask_id}"
-                try:
-                    response = requests.post(mask_url)
-                    if response.status_code == 200:
-                        mask_data = response.content
-                        mask_qimg = QImage()
-                        mask_qimg.loadFromData(mask_data, "PNG")
-                        mask_pixmap = QPixmap.fromImage(mask_qimg).scaled(
-                            self.image_label2.size(), Qt.KeepAspectRatio
-                        )
-                        self.image_label2.setPixmap(mask_pixmap)
-                    else:
-                        self.image_label2.setText("Mask 加载失败")
-                except Exception as e:
-                    self.image_label2.setText(f"Mask叠加失败: {str(e)}")
+                mask_pixmap = self.get_scaled_pixmap('image', mask_id, self.image_label2.size(), fmt="PNG")
+                if mask_pixmap is not None:
+                    self.image_label2.setPixmap(mask_pixmap)
+                else:
+                    self.image_label2.setText(self.loading_text('image', mask_id, "Mask 加载失败"))
             else:
                 self.image_label2.setText("无可用Mask")
         else:
-            qimg_orig = self.get_original_image()
-            if qimg_orig:
-                pixmap_orig = QPixmap.fromImage(qimg_orig).scaled(
-                    self.image_label2.size(), Qt.KeepAspectRatio
-                )
+            pixmap_orig = self.get_scaled_pixmap('image', self.image_id, self.image_label2.size())
+            if pixmap_orig is not None:
                 self.image_label2.setPixmap(pixmap_orig)
             else:
-                self.image_label2.setText("图像加载失败")
-
-
-    def get_label_image(self):
-        """
-        获取带检测框与标签的图像
-        :return: QImage 对象或 None
-        """
-        labeled_image_id = self.result.get('labeled_image_id')
-        if not labeled_image_id:
-            return None
-
-        labeled_url = f"{Server_URL}/labeled_image/{labeled_image_id}"
-        try:
-            response = requests.post(labeled_url)
-            if response.status_code == 200:
-                qimg = QImage()
-                qimg.loadFromData(response.content)
-                return qimg
-        except Exception as e:
-            print(f"❌ 获取 label_image 失败: {e}")
-            return None
-
-    def get_original_image(self):
-        """
-        获取原始图像（无检测框、mask）
-        :return: QImage 对象或 None
-        """
-        if not self.image_id:
-            return None
-
-        image_url = f"{Server_URL}/image/{self.image_id}"
-        try:
-            response = requests.post(image_url)
-            if response.status_code == 200:
-                qimg = QImage()
-                qimg.loadFromData(response.content)
-                return qimg
-        except Exception as e:
-            print(f"❌ 获取原始图像失败: {e}")
-            return None
+                self.image_label2.setText(self.loading_text('image', self.image_id, "图像加载失败"))
 
 
     def draw_image_with_mask(self, pixmap, selected_pred, show_segmentation=False):
@@ -611,88 +625,94 @@ class MainWindow(QWidget):
         if not pixmap or not selected_pred:
             return pixmap
 
-        # 创建 QImage 副本用于绘制
-        image = pixmap.toImage().copy()
-        image = image.convertToFormat(QImage.Format_RGBA8888)
-        painter = QPainter(image)
-
         # 绘制 mask
-        if show_segmentation:
-            mask_id = selected_pred.get('mask_id')
-            if mask_id:
-                mask_url = f"{Server_URL}/image/{mask_id}"
-                try:
-                    response = requests.post(mask_url)
-                    if response.status_code == 200:
-                        mask_data = response.content
-                        mask_qimg = QImage()
-                        mask_qimg.loadFromData(mask_data, "PNG")
-                        mask_pixmap = QPixmap.fromImage(mask_qimg).scaled(
-                            pixmap.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
-                        )
-                        painter.setOpacity(0.5)
-                        painter.drawPixmap(0, 0, mask_pixmap)
-                except Exception as e:
-                    print(f"Mask叠加失败: {str(e)}")
+        if not show_segmentation:
+            return pixmap
+
+        if self.state.show_all_masks:
+            selected_preds = self.result.get('predictions', [])
+        else:
+            selected_preds = [selected_pred]
+        overlay = self.mask_overlay(pixmap.size(), selected_preds)
+        if overlay is None:
+            return pixmap
 
+        # 创建 QImage 副本用于绘制
+        image = pixmap.toImage().convertToFormat(QImage.Format_RGBA8888)
+        painter = QPainter(image)
+        painter.drawImage(0, 0, overlay)
         painter.end()
         return QPixmap.fromImage(image)
 
+    def mask_overlay(self, size, selected_preds):
+        """
+        合成所选目标的彩色 mask 叠加图，尚未下载的 mask 会在下载完成后自动重绘
+        :param size: 叠加图尺寸（与显示的 pixmap 一致）
+        :param selected_preds: 需要叠加的目标列表
+        :return: RGBA QImage 或 None
+        """
+        key = (self.image_id, size.width(), size.height())
+        if key != self._compositor_key:
+            self.compositor.reset(size.width(), size.height())
+            self._compositor_key = key
+
+        selection = set()
+        for pred in selected_preds:
+            target_id = pred['id']
+            if not self.compositor.has_mask(target_id):
+                mask_qimg = self.fetch_image('image', pred.get('mask_id'), "PNG")
+                if mask_qimg is None:
+                    continue
+                self.compositor.add_mask(target_id, mask_qimg)
+            selection.add(target_id)
+
+        if not selection:
+            return None
+        return self.compositor.composite(selection)
+
     def save_result(self):
-        if self.image_label1.pixmap() is None:
+        '''在后台线程中将本次会话（含批量处理）的全部结果导出为单个归档'''
+        entries = list(self.session_results.values())
+        if hasattr(self, 'batch_window'):
+            exported = {result.get('image_id') for _, result in entries}
+            entries += [(path, result) for path, result in self.batch_window.model.results().items()
+                        if result.get('image_id') not in exported]
+        if not entries:
             from PyQt5.QtWidgets import QMessageBox
             QMessageBox.warning(self, "警告", "请先上传并处理图像后再保存结果")
             return
 
         options = QFileDialog.Options()
-        folder = QFileDialog.getExistingDirectory(self, "选择保存路径", options=options)
-        if not folder:
+        archive_path, _ = QFileDialog.getSaveFileName(self, "选择保存路径", "results.zip",
+                                                      "压缩包 (*.zip)", options=options)
+        if not archive_path:
             return
 
-        # 保存图像
-        window1_pixmap = self.image_label1.pixmap()
-        window2_pixmap = self.image_label2.pixmap()
-
-        if window1_pixmap:
-            window1_pixmap.save(os.path.join(folder, "result_image_window1.png"), "PNG")
-
-        if window2_pixmap:
-            window2_pixmap.save(os.path.join(folder, "result_image_window2.png"), "PNG")
-
-        # 拼接图像
-        if window1_pixmap and window2_pixmap:
-            try:
-                img1 = window1_pixmap.toImage()
-                img2 = window2_pixmap.toImage()
-
-                combined_width = img1.width() + img2.width()
-                combined_height = max(img1.height(), img2.height())
-
-                combined_image = QImage(combined_width, combined_height, QImage.Format_RGBA8888)
-                painter = QPainter(combined_image)
-
-                painter.drawImage(0, 0, img1)
-                painter.drawImage(img1.width(), 0, img2)
-
-                painter.end()
-
-                combined_pixmap = QPixmap.fromImage(combined_image)
-                combined_pixmap.save(os.path.join(folder, "result_image_combined.png"), "PNG")
-            except Exception as e:
-                print(f"❌ 合并图像失败: {str(e)}")
-
-        # 保存表格数据为 CSV
-        import csv
-        with open(os.path.join(folder, "results.csv"), 'w', newline='', encoding='GBK') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(["序号", "中文类别","英文类别","置信度", "坐标位置"])
-            for row in range(self.table.rowCount()):
-                row_data = []
-                for col in range(self.table.columnCount()):
-                    item = self.table.item(row, col)
-                    row_data.append(item.text() if item else "")
-                writer.writerow(row_data)
-        print("数据已保存到文件夹：", folder)
+        from PyQt5.QtWidgets import QProgressDialog
+        self.export_progress = QProgressDialog("正在导出...", "取消", 0, len(entries), self)
+        self.export_progress.setWindowTitle("保存结果")
+        self.export_progress.setWindowModality(Qt.WindowModal)
+        self.export_progress.setMinimumDuration(0)
+
+        self.export_worker = ExportThread(Server_URL, entries, archive_path, local_store=self.local_store,
+                                          parent=self)
+        self.export_worker.progress.connect(lambda done, total: self.export_progress.setValue(done))
+        self.export_worker.finished_signal.connect(self.on_export_finished)
+        self.export_worker.error_signal.connect(self.on_export_error)
+        self.export_progress.canceled.connect(self.export_worker.cancel)
+        self.save_result_button.setEnabled(False)
+        self.export_worker.start()
+
+    def on_export_finished(self, archive_path):
+        self.export_progress.reset()
+        self.save_result_button.setEnabled(True)
+        print("数据已保存到文件：", archive_path)
+
+    def on_export_error(self, message):
+        self.export_progress.reset()
+        self.save_result_button.setEnabled(True)
+        self.show_error_message(message)
+
     def select_file(self):
         options = QFileDialog.Options()
         file_name, _ = QFileDialog.getOpenFileName(
@@ -724,7 +744,9 @@ class MainWindow(QWidget):
         self.ymax_label.setText("ymax: N/A")
 
         # 下拉框清空
+        self.target_selection_combo.blockSignals(True)
         self.target_selection_combo.clear()
+        self.target_selection_combo.blockSignals(False)
 
         # 顶部信息栏
         self.total_targets_label.setText("总目标数:")
@@ -735,13 +757,43 @@ class MainWindow(QWidget):
 
 
 
+    # 当前阈值等请求参数
+    def current_form_data(self):
+        return {
+            'conf_threshold': self.confidence_threshold_spinbox.value() / 100,  # 转换为 0~1
+            'iou_threshold': self.iou_threshold_spinbox.value() / 100
+        }
+
+    # 批量处理窗口
+    def open_batch_window(self):
+        if not hasattr(self, 'batch_window'):
+            self.batch_window = BatchWindow(Server_URL, self.current_form_data, local_store=self.local_store,
+                                            parent=self)
+            self.batch_window.result_selected.connect(self.show_batch_result)
+        self.batch_window.show()
+        self.batch_window.raise_()
+
+    # 显示批量结果中选中的文件
+    def show_batch_result(self, result):
+        self.loader.cancel_all()  # 丢弃上一个文件尚未完成的下载
+        self.display_results(result)
+
     # 处理文件
     def process_file(self, file_path):
+        self.loader.cancel_all()  # 丢弃上一张图像尚未完成的下载
         self.image_label2.setText("正在处理...")
-        self.worker = PredictionThread(file_path,parent=self)
-        self.worker.finished_signal.connect(self.display_results)
+        if self.local_store is not None:
+            self.worker = LocalPredictionThread(file_path, self.current_form_data(), self.local_store, parent=self)
+        else:
+            self.worker = PredictionThread(file_path,parent=self)
+        self.worker.finished_signal.connect(lambda result: self.on_prediction_finished(file_path, result))
         self.worker.error_signal.connect(self.show_error_message)
         self.worker.start()
+    # 记录并显示预测结果
+    def on_prediction_finished(self, file_path, result):
+        if result.get('image_id'):
+            self.session_results[result['image_id']] = (file_path, result)
+        self.display_results(result)
     # 显示错误信息
     def show_error_message(self, message):
         from PyQt5.QtWidgets import QMessageBox
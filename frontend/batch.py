@@ -0,0 +1,395 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from PyQt5 import QtWidgets
+from PyQt5.QtCore import (Qt, QThread, QAbstractTableModel, QModelIndex, QSortFilterProxyModel,
+                          pyqtSignal)
+from PyQt5.QtWidgets import (QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QComboBox,
+                             QSpinBox, QTableView, QProgressBar, QFileDialog)
+
+from local_engine import predict_file
+
+
+SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.dcm')
+
+# 风险等级（后端为每个病灶返回 risk_level，数值越大风险越高）
+RISK_LEVELS = [
+    ('high', 3, '高风险'),
+    ('medium', 2, '中风险'),
+    ('low', 1, '低风险'),
+    ('none', 0, '无'),
+]
+RISK_VALUES = {key: level for key, level, _ in RISK_LEVELS}
+RISK_NAMES = {level: name for _, level, name in RISK_LEVELS}
+
+
+def collect_files(folder):
+    '''递归收集文件夹中支持的影像文件'''
+    files = []
+    for root, _, names in os.walk(folder):
+        for name in sorted(names):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                files.append(os.path.join(root, name))
+    return files
+
+
+def risk_level(result):
+    '''
+    取各病灶中的最高风险等级
+    旧版后端不返回 risk_level 时，只解析诊断总结中带【高风险】等标记的单类肿瘤结论（忽略多发病灶等总体建议）
+    '''
+    predictions = result.get('predictions', [])
+    if any('risk_level' in pred for pred in predictions):
+        return max((RISK_VALUES.get(pred.get('risk_level'), 0) for pred in predictions), default=0)
+    level = 0
+    for line in result.get('diagnosis_summary', []):
+        for _, value, name in RISK_LEVELS:
+            if f"【{name}】" in line:
+                level = max(level, value)
+                break
+    return level
+
+
+class BatchUploadThread(QThread):
+    '''批量上传：以可配置的并发数同时上传多个文件（本地模式下在进程内推理，结果保存在 store 中）'''
+    file_done = pyqtSignal(str, dict)  # 文件路径, 预测结果
+    file_failed = pyqtSignal(str, str)  # 文件路径, 错误信息
+    progress = pyqtSignal(int, int)  # 已完成数, 总数
+
+    def __init__(self, server_url, file_paths, form_data, max_in_flight=4, store=None, parent=None):
+        super().__init__(parent)
+        self.server_url = server_url
+        self.store = store  # 本地模式的 LocalStore，为 None 时上传到后端
+        self.file_paths = file_paths
+        self.form_data = form_data
+        self.max_in_flight = max_in_flight
+        self._cancelled = threading.Event()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _upload(self, path):
+        if self._cancelled.is_set():
+            return None
+        with open(path, 'rb') as f:
+            files = {'file': (os.path.basename(path), f)}
+            response = self.session.post(self.server_url + '/predict', files=files,
+                                         data=self.form_data, timeout=60 * 5)
+        if response.status_code != 200:
+            raise RuntimeError(f"服务器返回错误码：{response.status_code}")
+        return response.json()
+
+    def _predict_local(self, path):
+        if self._cancelled.is_set():
+            return None
+        result = predict_file(path, self.form_data, self.store)
+        if result is None:
+            raise RuntimeError("未得到推理结果")
+        return result
+
+    def run(self):
+        total = len(self.file_paths)
+        done = 0
+        task = self._predict_local if self.store is not None else self._upload
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = {pool.submit(task, path): path for path in self.file_paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                if future.cancelled():
+                    continue
+                try:
+                    result = future.result()
+                    if result is not None:
+                        self.file_done.emit(path, result)
+                except requests.exceptions.ConnectionError:
+                    self.file_failed.emit(path, "连接失败：后端服务未运行")
+                except Exception as e:
+                    self.file_failed.emit(path, str(e))
+                done += 1
+                self.progress.emit(done, total)
+                if self._cancelled.is_set():
+                    for pending in futures:
+                        pending.cancel()
+        self.session.close()
+
+
+class BatchResultModel(QAbstractTableModel):
+    '''
+    批量结果表格模型：每个预测目标一行，未检测到目标的文件占一行
+    数据只保存在 Python 列表中，不创建任何单元格控件，数万行依然流畅
+    '''
+    HEADERS = ["文件", "序号", "中文类别", "英文类别", "置信度", "风险等级", "坐标位置"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []  # (file_path, pred 或 None, 风险等级)
+        self._results = {}  # file_path -> 完整的预测结果
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path, pred, risk = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.UserRole:
+            return self._sort_value(path, pred, risk, column)
+        if role != Qt.DisplayRole:
+            return None
+        if column == 0:
+            return os.path.basename(path)
+        if column == 5:
+            return RISK_NAMES[risk]
+        if pred is None:
+            return "未检测到目标" if column == 2 else ""
+        if column == 1:
+            return str(pred['id'])
+        if column == 2:
+            return pred['label']
+        if column == 3:
+            return pred['original_label']
+        if column == 4:
+            return f"{pred['confidence']:.2f}"
+        bbox = pred['bbox']
+        return f"[{int(bbox[0])},{int(bbox[1])},{int(bbox[2])},{int(bbox[3])}]"
+
+    @staticmethod
+    def _sort_value(path, pred, risk, column):
+        '''排序使用的原始值（数值列按数值排序）'''
+        if column == 0:
+            return os.path.basename(path)
+        if column == 5:
+            return risk
+        if pred is None:
+            return '' if column in (2, 3) else -1
+        if column == 1:
+            return pred['id']
+        if column == 2:
+            return pred['label']
+        if column == 3:
+            return pred['original_label']
+        if column == 4:
+            return pred['confidence']
+        return pred['bbox'][0]
+
+    def add_result(self, path, result):
+        '''追加一个文件的全部预测结果'''
+        self._results[path] = result
+        risk = risk_level(result)
+        new_rows = [(path, pred, risk) for pred in result.get('predictions', [])] or [(path, None, risk)]
+        start = len(self._rows)
+        self.beginInsertRows(QModelIndex(), start, start + len(new_rows) - 1)
+        self._rows.extend(new_rows)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._rows = []
+        self._results = {}
+        self.endResetModel()
+
+    def row_file(self, row):
+        return self._rows[row][0]
+
+    def row_prediction(self, row):
+        return self._rows[row][1]
+
+    def row_risk(self, row):
+        return self._rows[row][2]
+
+    def result_for(self, path):
+        return self._results.get(path)
+
+    def results(self):
+        return dict(self._results)
+
+
+class BatchFilterProxy(QSortFilterProxyModel):
+    '''按类别、最低置信度和最低风险等级过滤，不重建任何控件'''
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSortRole(Qt.UserRole)
+        self.class_filter = None
+        self.min_confidence = 0.0
+        self.min_risk = 0
+
+    def set_filters(self, class_filter=None, min_confidence=0.0, min_risk=0):
+        self.class_filter = class_filter
+        self.min_confidence = min_confidence
+        self.min_risk = min_risk
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        pred = model.row_prediction(source_row)
+        if model.row_risk(source_row) < self.min_risk:
+            return False
+        if self.class_filter:
+            if pred is None or pred['label'] != self.class_filter:
+                return False
+        if self.min_confidence > 0 and (pred is None or pred['confidence'] < self.min_confidence):
+            return False
+        return True
+
+
+class BatchWindow(QWidget):
+    '''批量处理窗口：选择文件夹，并发上传，汇总并筛选所有结果'''
+    result_selected = pyqtSignal(dict)  # 点击某行时发出该文件的预测结果
+
+    def __init__(self, server_url, form_data_provider, local_store=None, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setWindowTitle("批量处理")
+        self.resize(900, 600)
+        self.server_url = server_url
+        self.local_store = local_store  # 本地模式下与主窗口共用，结果图像由主窗口的加载器读取
+        self.form_data_provider = form_data_provider  # 返回当前阈值等表单参数
+        self.worker = None
+        self.failed_files = []
+
+        self.model = BatchResultModel(self)
+        self.proxy = BatchFilterProxy(self)
+        self.proxy.setSourceModel(self.model)
+
+        self.select_folder_button = QPushButton("选择文件夹")
+        self.cancel_button = QPushButton("取消")
+        self.cancel_button.setEnabled(False)
+        self.in_flight_label = QLabel("并发数:")
+        self.in_flight_spinbox = QSpinBox()
+        self.in_flight_spinbox.setRange(1, 32)
+        self.in_flight_spinbox.setValue(4)
+        self.progress_bar = QProgressBar()
+        self.status_label = QLabel("暂无")
+
+        self.class_filter_combo = QComboBox()
+        self.class_filter_combo.addItem("全部类别", userData=None)
+        self.min_confidence_spinbox = QSpinBox()
+        self.min_confidence_spinbox.setRange(0, 100)
+        self.min_confidence_spinbox.setSuffix("%")
+        self.risk_filter_combo = QComboBox()
+        for _, level, name in sorted(RISK_LEVELS, key=lambda item: item[1]):
+            self.risk_filter_combo.addItem("全部风险等级" if level == 0 else f"{name}及以上", userData=level)
+
+        self.table_view = QTableView()
+        self.table_view.setModel(self.proxy)
+        self.table_view.setSortingEnabled(True)
+        self.table_view.setSelectionBehavior(QTableView.SelectRows)
+        self.table_view.setSelectionMode(QTableView.SingleSelection)
+        self.table_view.setAlternatingRowColors(True)
+        self.table_view.verticalHeader().setVisible(False)
+        self.table_view.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
+        self.table_view.horizontalHeader().setStretchLastSection(True)
+
+        control_layout = QHBoxLayout()
+        control_layout.addWidget(self.select_folder_button)
+        control_layout.addWidget(self.cancel_button)
+        control_layout.addWidget(self.in_flight_label)
+        control_layout.addWidget(self.in_flight_spinbox)
+        control_layout.addWidget(self.progress_bar)
+        control_layout.addWidget(self.status_label)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("类别:"))
+        filter_layout.addWidget(self.class_filter_combo)
+        filter_layout.addWidget(QLabel("最低置信度:"))
+        filter_layout.addWidget(self.min_confidence_spinbox)
+        filter_layout.addWidget(QLabel("风险等级:"))
+        filter_layout.addWidget(self.risk_filter_combo)
+
+        layout = QVBoxLayout()
+        layout.addLayout(control_layout)
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.table_view)
+        self.setLayout(layout)
+
+        self.select_folder_button.clicked.connect(self.select_folder)
+        self.cancel_button.clicked.connect(self.cancel)
+        self.class_filter_combo.currentIndexChanged.connect(self.apply_filters)
+        self.min_confidence_spinbox.valueChanged.connect(self.apply_filters)
+        self.risk_filter_combo.currentIndexChanged.connect(self.apply_filters)
+        self.table_view.clicked.connect(self.on_row_clicked)
+
+    def select_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "选择文件夹")
+        if not folder:
+            return
+        files = collect_files(folder)
+        if not files:
+            self.status_label.setText("文件夹中没有支持的影像文件")
+            return
+        self.start(files)
+
+    def start(self, files):
+        if self.worker is not None and self.worker.isRunning():
+            return
+        self.model.clear()
+        self.failed_files = []
+        self.class_filter_combo.blockSignals(True)
+        while self.class_filter_combo.count() > 1:
+            self.class_filter_combo.removeItem(1)
+        self.class_filter_combo.blockSignals(False)
+        self.progress_bar.setRange(0, len(files))
+        self.progress_bar.setValue(0)
+        self.status_label.setText(f"0/{len(files)}")
+
+        self.worker = BatchUploadThread(self.server_url, files, self.form_data_provider(),
+                                        max_in_flight=self.in_flight_spinbox.value(),
+                                        store=self.local_store, parent=self)
+        self.worker.file_done.connect(self.on_file_done)
+        self.worker.file_failed.connect(self.on_file_failed)
+        self.worker.progress.connect(self.on_progress)
+        self.worker.finished.connect(self.on_finished)
+        self.select_folder_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.worker.start()
+
+    def cancel(self):
+        if self.worker is not None:
+            self.worker.cancel()
+        self.cancel_button.setEnabled(False)
+
+    def on_file_done(self, path, result):
+        self.model.add_result(path, result)
+        for pred in result.get('predictions', []):
+            if self.class_filter_combo.findData(pred['label']) < 0:
+                self.class_filter_combo.addItem(pred['label'], userData=pred['label'])
+
+    def on_file_failed(self, path, message):
+        self.failed_files.append((path, message))
+        print(f"❌ 处理失败 {path}: {message}")
+
+    def on_progress(self, done, total):
+        self.progress_bar.setValue(done)
+        self.status_label.setText(f"{done}/{total}，失败 {len(self.failed_files)}")
+
+    def on_finished(self):
+        self.select_folder_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+    def apply_filters(self):
+        self.proxy.set_filters(self.class_filter_combo.currentData(),
+                               self.min_confidence_spinbox.value() / 100,
+                               self.risk_filter_combo.currentData() or 0)
+
+    def on_row_clicked(self, proxy_index):
+        '''点击某行时显示该文件的结果，图像通过缓存按需加载'''
+        source_index = self.proxy.mapToSource(proxy_index)
+        result = self.model.result_for(self.model.row_file(source_index.row()))
+        if result is not None:
+            self.result_selected.emit(result)
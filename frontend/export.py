@@ -0,0 +1,181 @@
+import io
+import json
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from PyQt5.QtCore import QThread, pyqtSignal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装 pyarrow 时导出为压缩 NPZ
+    pa = None
+
+
+# 按图像实际编码选择归档中的文件扩展名
+IMAGE_EXTENSIONS = {'image/png': '.png', 'image/jpeg': '.jpg', 'image/webp': '.webp'}
+
+
+def predictions_table(entries):
+    '''
+    将所有结果展开为列式表格（每个预测目标一行）
+    :param entries: [(名称, 预测结果)]
+    :return: dict 列名 -> numpy 数组
+    '''
+    columns = {
+        'file': [], 'image_id': [], 'target_id': [], 'label': [], 'original_label': [],
+        'confidence': [], 'x1': [], 'y1': [], 'x2': [], 'y2': [], 'area': [], 'physical_area': [],
+        'model_version': [],
+    }
+    for name, result in entries:
+        for pred in result.get('predictions', []):
+            x1, y1, x2, y2 = pred['bbox']
+            columns['file'].append(name)
+            columns['image_id'].append(result.get('image_id', ''))
+            columns['target_id'].append(pred['id'])
+            columns['label'].append(pred['label'])
+            columns['original_label'].append(pred['original_label'])
+            columns['confidence'].append(pred['confidence'])
+            columns['x1'].append(x1)
+            columns['y1'].append(y1)
+            columns['x2'].append(x2)
+            columns['y2'].append(y2)
+            # mask 统计（无 mask 或非 DICOM 时为 NaN）
+            mask_stats = pred.get('mask_stats') or {}
+            columns['area'].append(mask_stats.get('area', np.nan))
+            physical_area = mask_stats.get('physical_area')
+            columns['physical_area'].append(np.nan if physical_area is None else physical_area)
+            columns['model_version'].append(result.get('model_version') or '')
+    numeric = {'target_id': np.int32, 'confidence': np.float32,
+               'x1': np.float32, 'y1': np.float32, 'x2': np.float32, 'y2': np.float32,
+               'area': np.float32, 'physical_area': np.float32}
+    return {key: np.asarray(values, dtype=numeric.get(key, str)) for key, values in columns.items()}
+
+
+def encode_table(table):
+    '''列式表格编码：优先 Parquet，否则压缩 NPZ'''
+    buffer = io.BytesIO()
+    if pa is not None:
+        pq.write_table(pa.table({key: values.tolist() for key, values in table.items()}), buffer,
+                       compression='zstd')
+        return 'predictions.parquet', buffer.getvalue()
+    np.savez_compressed(buffer, **table)
+    return 'predictions.npz', buffer.getvalue()
+
+
+class ExportThread(QThread):
+    '''
+    后台导出：将整个会话 / 批量结果写入单个 zip 归档
+    原图、标注图与 mask 直接使用后端返回的原始分辨率字节，不经过界面控件重新渲染
+    本地模式下从 LocalStore 读取并编码，已被淘汰的图像不写入归档（result.json 仍然保留）
+    '''
+    progress = pyqtSignal(int, int)  # 已完成数, 总数
+    finished_signal = pyqtSignal(str)  # 归档路径
+    error_signal = pyqtSignal(str)
+
+    def __init__(self, server_url, entries, archive_path, max_workers=4, local_store=None, parent=None):
+        super().__init__(parent)
+        self.server_url = server_url
+        self.entries = entries  # [(名称, 预测结果)]
+        self.archive_path = archive_path
+        self.max_workers = max_workers
+        self.local_store = local_store
+        self._cancelled = threading.Event()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _download(self, endpoint, resource_id, codec=None):
+        '''返回 (字节, mimetype)，资源不存在时返回 None'''
+        if not resource_id or self._cancelled.is_set():
+            return None
+        if self.local_store is not None:
+            # 本地模式没有后端服务，已被 LocalStore 淘汰的结果直接跳过
+            return self.local_store.get_bytes(resource_id)
+        params = {'codec': codec} if codec else None
+        response = self.session.post(f"{self.server_url}/{endpoint}/{resource_id}", params=params, timeout=60)
+        if response.status_code != 200:
+            return None
+        return response.content, response.headers.get('Content-Type', '').split(';')[0].strip()
+
+    def _fetch_entry(self, entry):
+        '''下载一个结果的原图、标注图和所有 mask，文件扩展名与实际编码一致（如 DICOM 原图导出为 PNG）'''
+        name, result = entry
+        downloads = [('original', self._download('image', result.get('image_id'))),
+                     ('labeled', self._download('labeled_image', result.get('labeled_image_id')))]
+        for pred in result.get('predictions', []):
+            # mask 总是导出为 PNG，不受后端 MASK_CODEC（可能是按位原始数据）影响
+            downloads.append((f"mask_{pred['id']}", self._download('image', pred.get('mask_id'), codec='png')))
+        files = {}
+        for base, download in downloads:
+            if download is not None:
+                data, mimetype = download
+                files[base + IMAGE_EXTENSIONS.get(mimetype, '.png')] = data
+        return name, result, files
+
+    def _fetch_all(self, pool):
+        '''按顺序产出下载结果，最多同时提交 2 * max_workers 个条目，已下载未写入的数据不会无限堆积'''
+        pending = deque()
+        for entry in self.entries:
+            pending.append(pool.submit(self._fetch_entry, entry))
+            if len(pending) >= 2 * self.max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def run(self):
+        total = len(self.entries)
+        tmp_path = self.archive_path + '.part'
+        try:
+            with zipfile.ZipFile(tmp_path, 'w') as archive, \
+                    ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                used_names = set()
+                # 并发下载，按顺序写入归档（zipfile 不支持并发写）
+                for done, (name, result, files) in enumerate(self._fetch_all(pool), 1):
+                    if self._cancelled.is_set():
+                        break
+                    folder = self._unique_folder(name, used_names)
+                    for filename, data in files.items():
+                        # 图像本身已压缩，直接存储
+                        archive.writestr(f"{folder}/{filename}", data, compress_type=zipfile.ZIP_STORED)
+                    archive.writestr(f"{folder}/result.json", json.dumps(result, ensure_ascii=False, indent=2),
+                                     compress_type=zipfile.ZIP_DEFLATED)
+                    self.progress.emit(done, total)
+
+                if not self._cancelled.is_set():
+                    table_name, table_bytes = encode_table(predictions_table(self.entries))
+                    archive.writestr(table_name, table_bytes, compress_type=zipfile.ZIP_STORED)
+
+            if self._cancelled.is_set():
+                os.remove(tmp_path)
+                self.error_signal.emit("导出已取消")
+                return
+            os.replace(tmp_path, self.archive_path)
+            self.finished_signal.emit(self.archive_path)
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self.error_signal.emit(f"导出失败：{str(e)}")
+        finally:
+            self.session.close()
+
+    @staticmethod
+    def _unique_folder(name, used_names):
+        base = os.path.splitext(os.path.basename(name))[0] or 'result'
+        folder = base
+        index = 1
+        while folder in used_names:
+            index += 1
+            folder = f"{base}_{index}"
+        used_names.add(folder)
+        return folder
@@ -0,0 +1,183 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QThread, pyqtSignal
+from PyQt5.QtGui import QImage
+
+
+# 后端代码目录与模型路径（本地模式直接在进程内加载推理引擎）
+BACKEND_DIR = os.environ.get('BACKEND_DIR',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+LOCAL_MODEL_PATH = os.environ.get('LOCAL_MODEL_PATH', os.path.join(BACKEND_DIR, 'model.pt'))
+LOCAL_STORE_RESULTS = 50  # 本地模式保留的最近结果数
+MIMETYPES = {'PNG': 'image/png', 'JPG': 'image/jpeg'}  # LocalStore 编码格式 -> mimetype
+
+_engine_lock = threading.Lock()
+_engine = None
+_engine_module = None
+
+
+def get_engine():
+    '''
+    首次调用时加载推理引擎（导入 torch / ultralytics 并加载模型，较慢，应在工作线程中调用）
+    :return: (engine 模块, InferenceEngine)
+    '''
+    global _engine, _engine_module
+    with _engine_lock:
+        if _engine is None:
+            if BACKEND_DIR not in sys.path:
+                sys.path.insert(0, BACKEND_DIR)
+            import engine as engine_module
+            _engine = engine_module.create_engine(LOCAL_MODEL_PATH)
+            _engine_module = engine_module
+        return _engine_module, _engine
+
+
+def array_to_qimage(arr):
+    '''RGB / 灰度数组转 QImage（拷贝一份，脱离 numpy 内存）'''
+    arr = np.ascontiguousarray(arr)
+    height, width = arr.shape[:2]
+    if arr.ndim == 2:
+        return QImage(arr.data, width, height, arr.strides[0], QImage.Format_Grayscale8).copy()
+    return QImage(arr.data, width, height, arr.strides[0], QImage.Format_RGB888).copy()
+
+
+class LocalStore:
+    '''
+    本地模式的结果存储：资源 ID -> numpy 数组，替代后端的 /image 与 /labeled_image 接口
+    图像以数组形式保存在内存中，显示时直接转为 QImage，只有导出时才编码
+    '''
+
+    def __init__(self, max_results=LOCAL_STORE_RESULTS):
+        self.max_results = max_results
+        self._arrays = {}  # 资源 ID -> (数组, 编码格式)
+        self._results = OrderedDict()  # 结果 ID -> 该结果的资源 ID 列表
+        self._lock = threading.Lock()
+
+    def put_result(self, result_id, resources):
+        '''
+        保存一个结果的全部资源，超过上限时丢弃最早的结果
+        :param resources: {资源 ID: (数组, 'PNG' / 'JPG')}
+        '''
+        with self._lock:
+            self._arrays.update(resources)
+            self._results[result_id] = list(resources)
+            while len(self._results) > self.max_results:
+                _, resource_ids = self._results.popitem(last=False)
+                for resource_id in resource_ids:
+                    self._arrays.pop(resource_id, None)
+
+    def __contains__(self, resource_id):
+        with self._lock:
+            return resource_id in self._arrays
+
+    def get_qimage(self, resource_id):
+        with self._lock:
+            item = self._arrays.get(resource_id)
+        if item is None:
+            return None
+        return array_to_qimage(item[0])
+
+    def get_bytes(self, resource_id):
+        '''编码为文件字节（用于导出），返回 (字节, mimetype)'''
+        with self._lock:
+            item = self._arrays.get(resource_id)
+        if item is None:
+            return None
+        arr, fmt = item
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.WriteOnly)
+        array_to_qimage(arr).save(buffer, fmt)
+        buffer.close()
+        return bytes(data), MIMETYPES[fmt]
+
+    def clear(self):
+        with self._lock:
+            self._arrays.clear()
+            self._results.clear()
+
+
+def predict_file(file_path, form_data, store):
+    '''
+    在进程内对一个文件推理，图像与 mask 以数组形式保存在 store 中（单文件与批量处理共用）
+    :return: 与后端 /predict 结构相同的结果，未得到推理结果时返回 None
+    '''
+    engine_module, engine = get_engine()
+    start_time = time.time()
+    with open(file_path, 'rb') as f:
+        img, file_ext, dicom_metadata = engine_module.load_image(f, file_path)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')  # 同时完成读取，文件可以关闭
+
+    analysis = engine.analyze(img,
+                              float(form_data.get('conf_threshold', 0.5)),
+                              float(form_data.get('iou_threshold', 0.7)),
+                              form_data.get('mode', 'full'),
+                              form_data.get('model'),
+                              pixel_spacing=(dicom_metadata or {}).get('image_pixel_spacing'))
+    if analysis is None:
+        return None
+
+    predictions = analysis['predictions']
+    image_fmt = 'JPG' if file_ext == '.jpg' else 'PNG'
+    image_id = str(uuid.uuid4())
+    labeled_image_id = str(uuid.uuid4())
+    resources = {
+        image_id: (np.asarray(img), image_fmt),
+        labeled_image_id: (engine_module.render_labeled(analysis['result']), image_fmt),
+    }
+    if analysis['masks_data'] is not None:
+        from mask_analytics import resize_masks  # 与 engine 同在 BACKEND_DIR（get_engine 已加入 sys.path）
+        orig_h, orig_w = analysis['orig_shape']
+        masks = resize_masks(analysis['masks_data'], orig_w, orig_h)
+        for mask, pred in zip(masks, predictions):
+            pred['mask_id'] = str(uuid.uuid4())
+            resources[pred['mask_id']] = (mask, 'PNG')
+    store.put_result(image_id, resources)
+
+    model_entry = analysis['model_entry']
+    return {
+        'image_id': image_id,
+        'labeled_image_id': labeled_image_id,
+        'format': file_ext,
+        'predictions': predictions,
+        'total_detections': len(predictions),
+        'inference_time': round(time.time() - start_time, 2),
+        'diagnosis_summary': analysis['diagnosis_summary'],
+        'model': model_entry.name,
+        'model_version': model_entry.version,
+        'mode': form_data.get('mode', 'full'),
+        'triage_path': analysis['triage_path'],
+        'dicom': dicom_metadata,
+    }
+
+
+class LocalPredictionThread(QThread):
+    '''
+    本地模式的预测线程：在进程内调用推理引擎，不经过 HTTP
+    返回的结果结构与后端 /predict 相同，图像与 mask 以数组形式保存在 LocalStore 中
+    '''
+    finished_signal = pyqtSignal(dict)  # 成功返回结果
+    error_signal = pyqtSignal(str)     # 出现错误
+
+    def __init__(self, file_path, form_data, store, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.form_data = form_data
+        self.store = store
+
+    def run(self):
+        try:
+            result = predict_file(self.file_path, self.form_data, self.store)
+            if result is None:
+                self.error_signal.emit("未得到推理结果")
+                return
+            self.finished_signal.emit(result)
+        except Exception as e:
+            self.error_signal.emit(f"发生异常：{str(e)}")
@@ -0,0 +1,135 @@
+from collections import OrderedDict
+
+import numpy as np
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage
+
+
+# 各目标的叠加颜色（RGB）
+MASK_PALETTE = np.array([
+    [255, 0, 0],
+    [0, 200, 0],
+    [30, 144, 255],
+    [255, 165, 0],
+    [186, 85, 211],
+    [0, 206, 209],
+    [255, 215, 0],
+    [255, 105, 180],
+], dtype=np.float32)
+MASK_ALPHA = 128  # 叠加透明度（0.5）
+
+
+def qimage_to_mask(qimg, width, height):
+    '''将 mask QImage 缩放到显示尺寸并转为布尔数组'''
+    qimg = qimg.scaled(width, height, Qt.IgnoreAspectRatio, Qt.FastTransformation)
+    qimg = qimg.convertToFormat(QImage.Format_Grayscale8)
+    ptr = qimg.constBits()
+    ptr.setsize(qimg.byteCount())
+    arr = np.frombuffer(ptr, dtype=np.uint8).reshape(height, qimg.bytesPerLine())[:, :width]
+    return arr > 127
+
+
+def array_to_qimage(rgba):
+    '''RGBA 数组转 QImage（拷贝一份，脱离 numpy 内存）'''
+    height, width, _ = rgba.shape
+    return QImage(rgba.data, width, height, width * 4, QImage.Format_RGBA8888).copy()
+
+
+class MaskCompositor:
+    '''
+    多目标 mask 合成：
+    - 所有 mask 以按位压缩的数组保存在内存中
+    - 一次向量化计算得到任意目标子集的彩色叠加图
+    - 按选择缓存合成结果，切换单个目标时在当前累加结果上增量更新
+    '''
+
+    def __init__(self, cache_size=32):
+        self.width = 0
+        self.height = 0
+        self._packed = {}  # target_id -> 按位压缩的 mask
+        self._colors = {}  # target_id -> RGB
+        self._cache = OrderedDict()  # frozenset(target_ids) -> QImage
+        self._cache_size = cache_size
+        # 当前选择的累加结果，用于增量更新
+        self._selection = frozenset()
+        self._color_sum = None  # (H, W, 3) 颜色累加
+        self._count = None  # (H, W) 覆盖次数
+
+    def reset(self, width, height):
+        '''切换图像或显示尺寸时清空所有数据'''
+        self.width = width
+        self.height = height
+        self._packed.clear()
+        self._colors.clear()
+        self._cache.clear()
+        self._selection = frozenset()
+        self._color_sum = np.zeros((height, width, 3), dtype=np.float32)
+        self._count = np.zeros((height, width), dtype=np.int32)
+
+    def has_mask(self, target_id):
+        return target_id in self._packed
+
+    def add_mask(self, target_id, qimg):
+        '''登记一个目标的 mask（QImage），按显示尺寸压缩保存'''
+        mask = qimage_to_mask(qimg, self.width, self.height)
+        self._packed[target_id] = np.packbits(mask, axis=-1)
+        self._colors[target_id] = MASK_PALETTE[(target_id - 1) % len(MASK_PALETTE)]
+        # 已缓存的合成结果中可能缺少这个目标
+        self._cache.clear()
+        if target_id in self._selection:
+            self._apply(target_id, 1)
+
+    def _unpack(self, target_id):
+        return np.unpackbits(self._packed[target_id], axis=-1, count=self.width).astype(bool)
+
+    def _apply(self, target_id, sign):
+        '''在累加结果上增加 / 移除一个目标'''
+        mask = self._unpack(target_id)
+        self._count[mask] += sign
+        self._color_sum[mask] += sign * self._colors[target_id]
+
+    def _rebuild(self, selection):
+        '''一次向量化计算重建所选目标的累加结果'''
+        ids = [t for t in selection if t in self._packed]
+        if not ids:
+            self._color_sum.fill(0)
+            self._count.fill(0)
+            return
+        masks = np.stack([self._unpack(t) for t in ids]).astype(np.float32)  # (N, H, W)
+        colors = np.stack([self._colors[t] for t in ids])  # (N, 3)
+        self._count = masks.sum(axis=0).astype(np.int32)
+        self._color_sum = np.tensordot(masks, colors, axes=([0], [0]))  # (H, W, 3)
+
+    def composite(self, selection):
+        '''
+        返回所选目标的彩色叠加图（RGBA QImage，未覆盖处透明）
+        :param selection: 目标 id 的集合
+        '''
+        selection = frozenset(t for t in selection if t in self._packed)
+        cached = self._cache.get(selection)
+        if cached is not None:
+            self._cache.move_to_end(selection)
+            return cached
+
+        added = selection - self._selection
+        removed = self._selection - selection
+        if len(added) + len(removed) <= 2:
+            # 增量更新：只处理变化的目标
+            for target_id in removed:
+                self._apply(target_id, -1)
+            for target_id in added:
+                self._apply(target_id, 1)
+        else:
+            self._rebuild(selection)
+        self._selection = selection
+
+        covered = self._count > 0
+        rgba = np.zeros((self.height, self.width, 4), dtype=np.uint8)
+        rgba[covered, :3] = (self._color_sum[covered] / self._count[covered, None]).astype(np.uint8)
+        rgba[covered, 3] = MASK_ALPHA
+        overlay = array_to_qimage(rgba)
+
+        self._cache[selection] = overlay
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return overlay
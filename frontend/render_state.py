@@ -0,0 +1,72 @@
+from collections import deque
+
+from PyQt5.QtCore import QTimer
+
+
+# 界面中需要重绘的部分
+RENDER_RESULT = 'result'  # 诊断总结、目标下拉框、表格、顶部信息
+RENDER_TARGET = 'target'  # 当前目标的位置与置信度
+RENDER_IMAGES = 'images'  # 窗口1、窗口2 图像
+
+
+class RenderState:
+    '''
+    界面渲染状态：
+    - 控件事件只修改状态并标记需要重绘的部分
+    - 同一事件循环内的所有修改合并为一次渲染，只更新被标记的部分
+    - render_count / trace 记录每次渲染由哪些操作触发，用于确认每个用户操作只渲染一次
+    '''
+
+    def __init__(self, render_callback, trace=False, trace_size=200):
+        self.result = None  # 当前预测结果
+        self.selected_index = 0  # 当前选择的目标序号
+        self.show_segmentation = True  # 窗口1 叠加 mask
+        self.show_detection = False  # 窗口1 显示检测框与标签
+        self.show_all_masks = False  # 叠加全部目标的 mask
+        self.show_mask = True  # 窗口2 显示 mask（否则显示原图）
+
+        self.render_count = 0  # 渲染次数
+        self.action_count = 0  # 状态修改次数
+        self.trace = deque(maxlen=trace_size)  # [(渲染序号, 触发的操作, 重绘部分)]
+        self.print_trace = trace
+
+        self._render_callback = render_callback
+        self._dirty = set()
+        self._actions = []
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._flush)
+
+    def update(self, action, parts, **changes):
+        '''
+        修改状态并请求渲染
+        :param action: 触发修改的操作名称（用于追踪）
+        :param parts: 需要重绘的部分
+        '''
+        for name, value in changes.items():
+            setattr(self, name, value)
+        self.action_count += 1
+        self._actions.append(action)
+        self._dirty.update(parts)
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def selected_prediction(self):
+        if not self.result:
+            return None
+        predictions = self.result.get('predictions', [])
+        if 0 <= self.selected_index < len(predictions):
+            return predictions[self.selected_index]
+        return None
+
+    def _flush(self):
+        parts, actions = self._dirty, self._actions
+        self._dirty, self._actions = set(), []
+        if not parts:
+            return
+        self.render_count += 1
+        self.trace.append((self.render_count, tuple(actions), tuple(sorted(parts))))
+        if self.print_trace:
+            print(f"render #{self.render_count}: actions={actions} parts={sorted(parts)}")
+        self._render_callback(parts)
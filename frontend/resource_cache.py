@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtGui import QImage, QPixmap
+
+
+def estimate_bytes(value):
+    '''估算缓存对象占用的内存'''
+    if isinstance(value, QImage):
+        return value.byteCount()
+    if isinstance(value, QPixmap):
+        return value.width() * value.height() * max(value.depth(), 8) // 8
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 0
+
+
+class ImageCache:
+    '''
+    按内存上限淘汰的 LRU 缓存
+    后端返回的 image_id / mask_id 都是不可变的 UUID，可以放心缓存解码后的 QImage 与缩放后的 QPixmap
+    '''
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def put(self, key, value):
+        size = estimate_bytes(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._items) > 1:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
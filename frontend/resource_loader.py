@@ -0,0 +1,131 @@
+import requests
+from requests.adapters import HTTPAdapter
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+from PyQt5.QtGui import QImage
+
+
+# 按指定格式解码时向后端请求同一编码，不依赖后端 IMAGE_CODEC / MASK_CODEC 的默认值
+FORMAT_CODECS = {'PNG': 'png', 'JPG': 'jpeg'}
+
+
+class _FetchSignals(QObject):
+    done = pyqtSignal(int, object, object)  # generation, key, QImage
+    error = pyqtSignal(int, object, str)  # generation, key, 错误信息
+
+
+class _FetchTask(QRunnable):
+    '''在线程池中下载并解码一张图像（QImage 可以在非 GUI 线程中创建）'''
+
+    def __init__(self, session, url, key, fmt, generation, signals, timeout):
+        super().__init__()
+        self.session = session
+        self.url = url
+        self.key = key
+        self.fmt = fmt
+        self.generation = generation
+        self.signals = signals
+        self.timeout = timeout
+
+    def run(self):
+        try:
+            response = self.session.post(self.url, timeout=self.timeout)
+            if response.status_code != 200:
+                self.signals.error.emit(self.generation, self.key, f"服务器返回错误码：{response.status_code}")
+                return
+            qimg = QImage()
+            if self.fmt:
+                qimg.loadFromData(response.content, self.fmt)
+            else:
+                qimg.loadFromData(response.content)
+            if qimg.isNull():
+                self.signals.error.emit(self.generation, self.key, "图像解码失败")
+                return
+            self.signals.done.emit(self.generation, self.key, qimg)
+        except Exception as e:
+            self.signals.error.emit(self.generation, self.key, str(e))
+
+
+class ResourceLoader(QObject):
+    '''
+    异步图像加载器
+    - 线程池并发下载，共享一个 keep-alive 的 requests.Session
+    - 下载结果写入 ImageCache 后通过 loaded 信号通知界面
+    - cancel_all 丢弃排队中的请求，并忽略已发出的旧请求的结果
+    - 本地模式下资源直接从 LocalStore 读取，不经过 HTTP
+    '''
+    loaded = pyqtSignal(object)  # key
+    failed = pyqtSignal(object, str)  # key, 错误信息
+
+    def __init__(self, server_url, cache, max_workers=6, timeout=30, local_store=None, parent=None):
+        super().__init__(parent)
+        self.server_url = server_url
+        self.cache = cache
+        self.timeout = timeout
+        self.local_store = local_store
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_workers)
+        self._signals = _FetchSignals()
+        self._signals.done.connect(self._on_done)
+        self._signals.error.connect(self._on_error)
+        self._pending = set()  # 正在下载的 key
+        self._failed = set()  # 下载失败的 key，避免反复重试
+        self.generation = 0  # 每次取消后递增，用于丢弃过期结果
+
+    def request(self, endpoint, resource_id, fmt=None, priority=0):
+        '''
+        请求一张图像，已缓存、正在下载或已失败时直接忽略
+        :param priority: 优先级，数值越大越先下载
+        '''
+        if not resource_id:
+            return
+        key = (endpoint, resource_id)
+        if key in self._pending or key in self._failed or key in self.cache:
+            return
+        if self.local_store is not None:
+            # 本地结果无需下载，保持与下载完成相同的异步通知；已被淘汰的结果没有后端可以回退
+            if resource_id in self.local_store:
+                self.cache.put(key, self.local_store.get_qimage(resource_id))
+                QTimer.singleShot(0, lambda: self.loaded.emit(key))
+            else:
+                self._pending.add(key)
+                generation = self.generation
+                QTimer.singleShot(0, lambda: self._on_error(generation, key, "本地结果已被清理"))
+            return
+        self._pending.add(key)
+        url = f"{self.server_url}/{endpoint}/{resource_id}"
+        if fmt:
+            url += f"?codec={FORMAT_CODECS[fmt]}"
+        task = _FetchTask(self.session, url, key, fmt, self.generation, self._signals, self.timeout)
+        self.pool.start(task, priority)
+
+    def is_pending(self, key):
+        return key in self._pending
+
+    def retry_failed(self):
+        self._failed.clear()
+
+    def cancel_all(self):
+        '''取消所有未完成的请求（例如用户打开了新文件）'''
+        self.generation += 1
+        self.pool.clear()
+        self._pending.clear()
+        self._failed.clear()
+
+    def _on_done(self, generation, key, qimg):
+        if generation != self.generation:
+            return
+        self._pending.discard(key)
+        self.cache.put(key, qimg)
+        self.loaded.emit(key)
+
+    def _on_error(self, generation, key, message):
+        if generation != self.generation:
+            return
+        self._pending.discard(key)
+        self._failed.add(key)
+        print(f"❌ 获取图像失败 {key}: {message}")
+        self.failed.emit(key, message)
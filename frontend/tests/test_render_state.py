@@ -0,0 +1,43 @@
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+from render_state import RENDER_IMAGES, RENDER_RESULT, RENDER_TARGET, RenderState
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+def run_event_loop(app, ms=20):
+    QtCore.QTimer.singleShot(ms, app.quit)
+    app.exec_()
+
+
+def test_updates_in_one_tick_render_once(app):
+    rendered = []
+    state = RenderState(rendered.append)
+    state.update('result', {RENDER_RESULT, RENDER_TARGET, RENDER_IMAGES}, result={'predictions': []})
+    state.update('target', {RENDER_TARGET}, selected_index=1)
+    state.update('segmentation', {RENDER_IMAGES}, show_segmentation=False)
+    run_event_loop(app)
+
+    assert state.render_count == 1
+    assert state.action_count == 3
+    assert rendered == [{RENDER_RESULT, RENDER_TARGET, RENDER_IMAGES}]
+    assert state.trace[-1] == (1, ('result', 'target', 'segmentation'),
+                               tuple(sorted({RENDER_RESULT, RENDER_TARGET, RENDER_IMAGES})))
+    assert state.selected_index == 1 and state.show_segmentation is False
+
+
+def test_each_tick_renders_only_marked_parts(app):
+    rendered = []
+    state = RenderState(rendered.append)
+    state.update('target', {RENDER_TARGET}, selected_index=2)
+    run_event_loop(app)
+    state.update('detection', {RENDER_IMAGES}, show_detection=True)
+    run_event_loop(app)
+
+    assert state.render_count == 2
+    assert rendered == [{RENDER_TARGET}, {RENDER_IMAGES}]